@@ -8,17 +8,18 @@ import os
 import time
 import asyncio
 
-from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 
 from config import Config
-from models import AskRequest, AskResponse
+from models import AskRequest, AskResponse, FAISSUpsertRequest, FAISSDeleteRequest
 from constants import SMALL_TALK
 from utils import get_client_ip, InputValidator
 from lifecycle import (
     lifespan,
     get_redis,
+    get_redis_binary,
     get_llm_service,
     get_faiss_index,
     get_hybrid_search,
@@ -27,11 +28,16 @@ from lifecycle import (
 from services import (
     KnowledgeBase,
     FAISSIndex,
+    EmbeddingCache,
     HybridSearch,
     LLMCache,
     FreeChatCache,
+    LLMSingleFlight,
+    SemanticCache,
     RateLimiter,
+    RedisCircuitBreaker,
     BudgetService,
+    LLMRequestBatch,
 )
 
 
@@ -73,9 +79,10 @@ async def ask(req: AskRequest, request: Request):
     
     # 2. Rate limit
     rate_limiter = RateLimiter(redis_client)
-    allowed, error = await rate_limiter.check(ip, request)
+    allowed, error, remaining = await rate_limiter.check_with_quota(ip, request)
     if not allowed:
-        raise HTTPException(429, error)
+        headers = {f"X-RateLimit-Remaining-{k.title()}": str(v) for k, v in remaining.items()}
+        raise HTTPException(429, error, headers=headers)
     
     # 3. Small talk check
     if question.lower() in SMALL_TALK:
@@ -94,12 +101,15 @@ async def ask(req: AskRequest, request: Request):
     kb = KnowledgeBase.get_instance()
     
     # ===== Layer 1: Direct Search (Hybrid if available) =====
+    # Search once - the same result serves direct answer, LLM context and fallbacks
     if hybrid_search and hybrid_search.faiss_index.is_ready():
-        direct = await hybrid_search.get_direct_answer(question)
-        context = await hybrid_search.get_context_for_llm(question) if not direct else None
+        retrieval = await hybrid_search.retrieve(question)
     else:
-        direct = kb.get_direct_answer(question)
-        context = kb.get_context_for_llm(question) if not direct else None
+        retrieval = kb.retrieve(question)
+    
+    direct = retrieval.direct
+    context = retrieval.context
+    context_key = retrieval.context_key
     
     if direct:
         return AskResponse(
@@ -120,19 +130,21 @@ async def ask(req: AskRequest, request: Request):
     
     # Has KB context → summarize with LLM
     if not llm_service or not llm_service.is_available():
-        results = kb.search(question)
-        if results:
+        top = retrieval.fallback
+        if top:
             return AskResponse(
-                answer=results[0]["a"],
-                source=results[0]["q"],
+                answer=top["a"],
+                source=top["q"],
                 used_llm=False,
-                score=results[0]["score"]
+                score=top["score"]
             )
         return AskResponse(answer="Sorry, no information found.", used_llm=False)
     
-    # Check LLM cache (include context)
+    # Check LLM cache (keyed by question + context doc ids/versions) + budget - one round trip
     llm_cache = LLMCache(redis_client)
-    cached_answer = await llm_cache.get(question, context)
+    budget_service = BudgetService(redis_client)
+    batch = LLMRequestBatch(redis_client, llm_cache, budget_service)
+    cached_answer, budget_exceeded = await batch.prefetch(question, context_key)
     if cached_answer:
         print(f"[TELEMETRY] summarize cache_hit=true")
         return AskResponse(
@@ -141,39 +153,65 @@ async def ask(req: AskRequest, request: Request):
             cached=True
         )
     
-    # Check budget
-    budget_service = BudgetService(redis_client)
-    if await budget_service.is_budget_exceeded():
-        results = kb.search(question)
-        if results:
+    # Check semantic cache (paraphrase of an answered question, same KB docs)
+    semantic_cache = SemanticCache.get_instance()
+    cached_answer = await semantic_cache.get(retrieval.query_vector, context_key)
+    if cached_answer:
+        llm_cache.record_hit("semantic")
+        print(f"[TELEMETRY] summarize cache_hit=true semantic=true")
+        return AskResponse(
+            answer=cached_answer,
+            used_llm=True,
+            cached=True
+        )
+    
+    # Check budget (read in the prefetch above)
+    if budget_exceeded:
+        top = retrieval.fallback
+        if top:
             return AskResponse(
-                answer=results[0]["a"],
-                source=results[0]["q"],
+                answer=top["a"],
+                source=top["q"],
                 used_llm=False,
-                score=results[0]["score"]
+                score=top["score"]
             )
         return AskResponse(
             answer="Sorry, no related information found.",
             used_llm=False
         )
     
-    # Call LLM
+    # Call LLM (once per question+context across concurrent requests/workers)
+    async def call_llm() -> tuple[str, dict]:
+        company_info = kb.get_company_info()
+        answer, usage = await llm_service.summarize(question, context, company_info)
+        
+        if not usage:
+            # Failed call (fallback text) - never cached, waiting workers make their own call
+            return answer, usage
+        
+        # Record cost + cache answer in one MULTI
+        # (before releasing single-flight lock - other workers read it)
+        await batch.commit(question, answer, context_key, usage)
+        semantic_cache.add(retrieval.query_vector, context_key, llm_cache.key_for(question, context_key))
+        return answer, usage
+    
     start_time = time.time()
-    company_info = kb.get_company_info()
-    answer, usage = await llm_service.summarize(question, context, company_info)
+    single_flight = LLMSingleFlight(redis_client, llm_cache)
+    answer, usage, shared = await single_flight.do(question, context_key, call_llm)
     latency = time.time() - start_time
     
-    cost = 0.0
-    if usage:
-        await budget_service.add_cost(
-            usage.get("input_tokens", 0),
-            usage.get("output_tokens", 0)
+    if shared:
+        llm_cache.record_hit("coalesced")
+        print(f"[TELEMETRY] summarize cache_hit=false coalesced=true latency={latency:.2f}s")
+        return AskResponse(
+            answer=answer,
+            used_llm=True,
+            cached=True
         )
-        cost = (usage.get("input_tokens", 0) / 1_000_000) * Config.COST_INPUT_PER_1M
-        cost += (usage.get("output_tokens", 0) / 1_000_000) * Config.COST_OUTPUT_PER_1M
     
-    # Cache answer
-    await llm_cache.set(question, answer, context)
+    cost = 0.0
+    if usage:
+        cost = BudgetService.cost_of(usage.get("input_tokens", 0), usage.get("output_tokens", 0))
     
     print(f"[TELEMETRY] summarize used_llm=true cache_hit=false "
           f"input_tokens={usage.get('input_tokens', 0)} "
@@ -235,22 +273,28 @@ async def status(request: Request):
     
     llm_cache = LLMCache(redis_client)
     cache_stats = await llm_cache.get_stats()
+    cache_stats.update(SemanticCache.get_instance().get_stats())
+    cache_stats.update(EmbeddingCache.local.get_stats())
     
     return {
         "rate_limits": remaining,
         "budget": budget,
         "cache": cache_stats,
+        "redis": RedisCircuitBreaker.get_instance().get_stats(),
         "llm_available": llm_service.is_available() if llm_service else False,
         "llm_enabled": (llm_service.is_available() if llm_service else False) and not budget["exceeded"],
         "model": Config.MODEL if llm_service and llm_service.is_available() else None,
         "faiss": {
             "enabled": Config.USE_FAISS,
             "ready": faiss_index.is_ready() if faiss_index else False,
-            "vectors": faiss_index.index.ntotal if faiss_index and faiss_index.is_ready() else 0
+            "vectors": faiss_index.index.ntotal if faiss_index and faiss_index.is_ready() else 0,
+            "index": faiss_index.get_index_info() if faiss_index else {},
+            "build": faiss_index.get_build_status() if faiss_index else None
         },
         "search_weights": {
             "faiss": Config.FAISS_WEIGHT,
-            "keyword": Config.KEYWORD_WEIGHT
+            "keyword": Config.KEYWORD_WEIGHT,
+            "lexical": Config.LEXICAL_WEIGHT
         }
     }
 
@@ -259,44 +303,103 @@ async def status(request: Request):
 async def reload_kb():
     """Force reload knowledge base"""
     kb = KnowledgeBase.get_instance()
-    kb.load(force=True)
-    return {"status": "reloaded", "count": len(kb._data.get("qa", []))}
+    await asyncio.to_thread(kb.load, True)
+    return {"status": "reloaded", "count": len(kb.get_all_qa())}
+
+
+# Published artifacts are immutable - index changes go through the offline builder
+ARTIFACTS_READ_ONLY = "Index is served from published artifacts - run build_index.py to change it"
 
 
 @app.post("/api/faiss/rebuild")
-async def rebuild_faiss(background_tasks: BackgroundTasks):
-    """Rebuild FAISS index in background"""
-    redis_client = get_redis()
+async def rebuild_faiss():
+    """Rebuild FAISS index in background (current index keeps serving until the swap)"""
+    redis_binary = get_redis_binary()
     
     if not Config.USE_FAISS:
         raise HTTPException(400, "FAISS is disabled")
     
+    if Config.INDEX_ARTIFACTS:
+        raise HTTPException(409, ARTIFACTS_READ_ONLY)
+    
     if not Config.OPENAI_API_KEY:
         raise HTTPException(400, "OpenAI API key not configured")
     
     kb = KnowledgeBase.get_instance()
-    kb.load(force=True)
+    await asyncio.to_thread(kb.load, True)
     qa_list = kb.get_all_qa()
     
     if not qa_list:
         raise HTTPException(400, "No Q&A items in knowledge base")
     
-    async def do_rebuild():
-        faiss_idx = FAISSIndex.get_instance()
-        faiss_idx.set_redis(redis_client)
-        await faiss_idx.build_async(qa_list)
+    faiss_idx = FAISSIndex.get_instance()
+    faiss_idx.set_redis(redis_binary)
+    # HybridSearch reads whichever index is live - keyword-only until the first one lands
+    if get_hybrid_search() is None:
         set_hybrid_search(HybridSearch(kb, faiss_idx))
-        print(f"[INFO] FAISS rebuild complete: {faiss_idx.index.ntotal} vectors")
     
-    background_tasks.add_task(asyncio.create_task, do_rebuild())
+    # Serialized: a request during a running build queues one follow-up build
+    build = faiss_idx.request_rebuild(qa_list)
     
     return {
-        "status": "rebuilding",
+        "status": "queued" if build["pending"] else "rebuilding",
         "message": "Index rebuild started in background",
-        "items": len(qa_list)
+        "items": len(qa_list),
+        "build": build
     }
 
 
+@app.get("/api/faiss/build")
+async def faiss_build_status():
+    """Progress of the running / last FAISS build (embedding batches, retries, state)"""
+    faiss_index = get_faiss_index()
+    if not faiss_index:
+        raise HTTPException(400, "FAISS is disabled")
+    
+    return {
+        "build": faiss_index.get_build_status(),
+        "index": faiss_index.get_index_info(),
+        "vectors": faiss_index.index.ntotal if faiss_index.is_ready() else 0
+    }
+
+
+@app.post("/api/faiss/upsert")
+async def upsert_faiss(req: FAISSUpsertRequest):
+    """Add / replace Q&A vectors without a rebuild (only changed items are embedded)"""
+    faiss_index = get_faiss_index()
+    if Config.INDEX_ARTIFACTS:
+        raise HTTPException(409, ARTIFACTS_READ_ONLY)
+    if not faiss_index or not faiss_index.is_ready():
+        raise HTTPException(400, "FAISS index not ready")
+    
+    if any(not str(item.get("q", "")).strip() for item in req.items):
+        raise HTTPException(400, "Every item needs a question (q)")
+    
+    try:
+        return await faiss_index.upsert(req.items)
+    except ValueError as e:
+        raise HTTPException(409, str(e))
+    except RuntimeError as e:
+        # Index not saved - the previous one keeps serving
+        raise HTTPException(500, str(e))
+
+
+@app.post("/api/faiss/delete")
+async def delete_faiss(req: FAISSDeleteRequest):
+    """Remove Q&A vectors by id"""
+    faiss_index = get_faiss_index()
+    if Config.INDEX_ARTIFACTS:
+        raise HTTPException(409, ARTIFACTS_READ_ONLY)
+    if not faiss_index or not faiss_index.is_ready():
+        raise HTTPException(400, "FAISS index not ready")
+    
+    try:
+        return await faiss_index.delete(req.ids)
+    except RuntimeError as e:
+        # Index not saved - the previous one keeps serving
+        raise HTTPException(500, str(e))
+
+
 @app.get("/")
 async def index():
     """Serve frontend"""
@@ -310,5 +413,10 @@ async def index():
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    print(f"[INFO] FAQ Bot starting on http://localhost:{port}")
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    workers = int(os.getenv("WORKERS", 1))
+    print(f"[INFO] FAQ Bot starting on http://localhost:{port} ({workers} worker(s))")
+    if workers > 1:
+        # Multiple workers need an import string
+        uvicorn.run("app:app", host="0.0.0.0", port=port, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
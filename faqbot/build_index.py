@@ -0,0 +1,79 @@
+"""
+FAQ Bot - Offline Index Builder
+===============================
+knowledge.json → versioned artifact (docs, keyword automaton, BM25, FAISS index)
+published to ARTIFACT_DIR. Servers with INDEX_ARTIFACTS=true only load it.
+
+    python build_index.py [--kb knowledge.json] [--no-publish] [--keep N]
+"""
+
+import sys
+import json
+import asyncio
+import argparse
+
+from config import Config
+from services import KnowledgeBase, FAISSIndex, create_openai_client
+from services import artifacts
+
+
+async def build(kb_path: str, publish: bool = True, keep: int = Config.ARTIFACT_KEEP) -> str:
+    """Build one artifact and (optionally) publish it. Returns the artifact directory"""
+    with open(kb_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    
+    kb_snapshot = KnowledgeBase.get_instance().index_data(data)
+    qa_list = kb_snapshot.data.get("qa", [])
+    print(f"[INFO] KB indexed: {len(qa_list)} items, {kb_snapshot.index.keyword_count} keywords")
+    
+    files = KnowledgeBase.artifact_files(kb_snapshot)
+    manifest = {
+        "source": kb_path,
+        "kb_version": kb_snapshot.version,
+        "items": len(qa_list),
+        "embedding_model": Config.EMBEDDING_MODEL,
+        "embedding_dim": None,
+        "index": None,
+    }
+    
+    if Config.USE_FAISS and Config.OPENAI_API_KEY and qa_list:
+        openai_client = create_openai_client()
+        try:
+            faiss_index = FAISSIndex.get_instance()
+            faiss_index.set_openai(openai_client)
+            index_snapshot = await faiss_index.build_snapshot(qa_list)
+        finally:
+            await openai_client.close()
+        files.update(FAISSIndex.artifact_files(index_snapshot))
+        manifest.update(embedding_dim=index_snapshot.dim, index=index_snapshot.info)
+    else:
+        print("[WARN] FAISS disabled or KB empty - artifact has keyword / BM25 search only")
+    
+    path = await asyncio.to_thread(
+        artifacts.write_artifact, artifacts.new_version(kb_snapshot.version), files, manifest
+    )
+    print(f"[INFO] Artifact written: {path}")
+    
+    if publish:
+        artifacts.publish(path, keep)
+        print(f"[INFO] Artifact published: {artifacts.pointer_path()} -> {path}")
+    return path
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Build and publish a FAQ Bot index artifact")
+    parser.add_argument("--kb", default=Config.KNOWLEDGE_FILE, help="knowledge.json to index")
+    parser.add_argument("--no-publish", action="store_true", help="write the artifact without switching servers to it")
+    parser.add_argument("--keep", type=int, default=Config.ARTIFACT_KEEP, help="artifacts to keep after publishing")
+    args = parser.parse_args()
+    
+    try:
+        asyncio.run(build(args.kb, publish=not args.no_publish, keep=args.keep))
+    except Exception as e:
+        print(f"[ERROR] Index build failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,6 +8,10 @@ import os
 class Config:
     # Redis
     REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    # Circuit breaker: consecutive failures to open / seconds between health probes
+    REDIS_BREAKER_THRESHOLD = int(os.getenv("REDIS_BREAKER_THRESHOLD", "5"))
+    REDIS_BREAKER_COOLDOWN = float(os.getenv("REDIS_BREAKER_COOLDOWN", "5"))
+    REDIS_BREAKER_PROBE_TIMEOUT = float(os.getenv("REDIS_BREAKER_PROBE_TIMEOUT", "1"))
     
     # OpenAI (Layer 2 only)
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
@@ -20,8 +24,18 @@ class Config:
     # Global Rate Limit (all users combined - protect against distributed attacks)
     GLOBAL_RATE_LIMIT_PER_MINUTE = int(os.getenv("GLOBAL_RATE_LIMIT_PER_MINUTE", "200"))
     
+    # Local token-bucket pre-filter (per process, in front of Redis)
+    LOCAL_RATE_LIMIT_ENABLED = os.getenv("LOCAL_RATE_LIMIT_ENABLED", "true").lower() == "true"
+    LOCAL_RATE_LIMIT_MAX_KEYS = int(os.getenv("LOCAL_RATE_LIMIT_MAX_KEYS", "10000"))
+    LOCAL_RATE_LIMIT_BURST = float(os.getenv("LOCAL_RATE_LIMIT_BURST", "1.5"))
+    LOCAL_RATE_LIMIT_SYNC_MS = int(os.getenv("LOCAL_RATE_LIMIT_SYNC_MS", "1000"))
+    
     # Knowledge Base
     KNOWLEDGE_FILE = os.getenv("KNOWLEDGE_FILE", "/data/knowledge/knowledge.json")
+    # Background reload: auto (inotify, polling fallback) | poll | off
+    KB_WATCH = os.getenv("KB_WATCH", "auto").lower()
+    KB_WATCH_INTERVAL = float(os.getenv("KB_WATCH_INTERVAL", "2"))
+    KB_WATCH_DEBOUNCE_MS = int(os.getenv("KB_WATCH_DEBOUNCE_MS", "200"))
     
     # Search Settings
     SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.7"))
@@ -31,10 +45,33 @@ class Config:
     LLM_TIMEOUT = int(os.getenv("LLM_TIMEOUT", "30"))
     MAX_TOKENS = int(os.getenv("MAX_TOKENS", "500"))
     
+    # OpenAI HTTP connection pool (shared by chat + embeddings)
+    OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+    OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+    OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+    OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+    OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "true").lower() == "true"
+    
     # Cache Settings
     LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "3600"))
+    
+    # In-process tier in front of the Redis caches (per worker memory budget)
+    LOCAL_CACHE_EMBEDDING_MB = float(os.getenv("LOCAL_CACHE_EMBEDDING_MB", "32"))
+    LOCAL_CACHE_ANSWER_MB = float(os.getenv("LOCAL_CACHE_ANSWER_MB", "16"))
+    LOCAL_CACHE_TTL = int(os.getenv("LOCAL_CACHE_TTL", "600"))
     FREE_CHAT_CACHE_TTL = int(os.getenv("FREE_CHAT_CACHE_TTL", "300"))  # 5 minutes
     
+    # Semantic answer cache (paraphrases of answered questions, per worker)
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+    SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+    SEMANTIC_CACHE_MAX_SIZE = int(os.getenv("SEMANTIC_CACHE_MAX_SIZE", "2000"))
+    SEMANTIC_CACHE_CANDIDATES = 5
+    
+    # Single-flight LLM calls (cross-worker lock while one worker calls the LLM)
+    LLM_LOCK_TTL = float(os.getenv("LLM_LOCK_TTL", "35"))  # > LLM_TIMEOUT
+    LLM_LOCK_POLL_MS = float(os.getenv("LLM_LOCK_POLL_MS", "100"))
+    
     # Input Validation
     MAX_QUESTION_LENGTH = int(os.getenv("MAX_QUESTION_LENGTH", "200"))
     MAX_EMOJI_COUNT = int(os.getenv("MAX_EMOJI_COUNT", "3"))
@@ -49,12 +86,74 @@ class Config:
     # FAISS / Embedding Settings
     EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
     EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "1536"))
+    # Cached query embeddings in Redis: float32 (exact) | float16 | int8
+    EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16").lower()
     FAISS_INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "/data/knowledge/faiss.index")
+    # Persistent build embeddings (one .npy per EMBEDDING_MODEL) - rebuilds only embed changed texts
+    EMBEDDING_STORE_DIR = os.getenv(
+        "EMBEDDING_STORE_DIR", os.path.join(os.path.dirname(FAISS_INDEX_PATH), "embeddings")
+    )
     USE_FAISS = os.getenv("USE_FAISS", "true").lower() == "true"
     
-    # Hybrid Search Weights (FAISS score * weight + keyword score * weight)
+    # Index-build embedding: token-aware batches, requests in parallel, 429 / 5xx retried
+    # with exponential backoff, progress checkpointed to the embedding store (resumable)
+    EMBEDDING_BUILD_CONCURRENCY = int(os.getenv("EMBEDDING_BUILD_CONCURRENCY", "4"))
+    EMBEDDING_BUILD_BATCH_SIZE = int(os.getenv("EMBEDDING_BUILD_BATCH_SIZE", "100"))
+    # Per-request token cap (estimated as UTF-8 bytes - an upper bound; the API allows 300k)
+    EMBEDDING_BUILD_BATCH_TOKENS = int(os.getenv("EMBEDDING_BUILD_BATCH_TOKENS", "100000"))
+    EMBEDDING_BUILD_MAX_RETRIES = int(os.getenv("EMBEDDING_BUILD_MAX_RETRIES", "6"))
+    EMBEDDING_BUILD_BACKOFF = float(os.getenv("EMBEDDING_BUILD_BACKOFF", "1"))
+    EMBEDDING_BUILD_BACKOFF_MAX = float(os.getenv("EMBEDDING_BUILD_BACKOFF_MAX", "60"))
+    EMBEDDING_CHECKPOINT_ROWS = int(os.getenv("EMBEDDING_CHECKPOINT_ROWS", "5000"))
+    
+    # FAISS index type: auto | flat | hnsw | sq8 | ivfpq
+    # auto: exact flat while small, then the fastest type that fits FAISS_MEMORY_BUDGET_MB
+    FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto").lower()
+    FAISS_MEMORY_BUDGET_MB = int(os.getenv("FAISS_MEMORY_BUDGET_MB", "1024"))
+    FAISS_FLAT_MAX_VECTORS = int(os.getenv("FAISS_FLAT_MAX_VECTORS", "20000"))
+    FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+    FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "80"))
+    FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+    FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+    FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "64"))
+    FAISS_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "100000"))
+    # Build-time guardrail: approximate index must reach this recall@k vs exact search, else flat
+    FAISS_RECALL_K = int(os.getenv("FAISS_RECALL_K", "10"))
+    FAISS_MIN_RECALL = float(os.getenv("FAISS_MIN_RECALL", "0.9"))
+    FAISS_RECALL_SAMPLE = int(os.getenv("FAISS_RECALL_SAMPLE", "256"))
+    
+    # Serving mode: FAISS vectors + Q&A docs memory-mapped from disk, so N uvicorn
+    # workers share one copy in the page cache instead of N private heaps
+    MMAP_SERVING = os.getenv("MMAP_SERVING", "false").lower() == "true"
+    DOC_STORE_DIR = os.getenv("DOC_STORE_DIR", os.path.join(os.path.dirname(FAISS_INDEX_PATH), "docs"))
+    
+    # Offline builds (python build_index.py): servers only load + hot-swap the published
+    # artifact (KB, keyword automaton, FAISS index) instead of indexing in-process
+    INDEX_ARTIFACTS = os.getenv("INDEX_ARTIFACTS", "false").lower() == "true"
+    ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join(os.path.dirname(FAISS_INDEX_PATH), "artifacts"))
+    ARTIFACT_KEEP = int(os.getenv("ARTIFACT_KEEP", "3"))
+    # sha256 every file before swapping an artifact in
+    ARTIFACT_VERIFY = os.getenv("ARTIFACT_VERIFY", "true").lower() == "true"
+    
+    # Query embedding micro-batching (concurrent cache misses → one API call)
+    EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+    EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "64"))
+    
+    # FAISS query batching (concurrent searches → one index.search in a thread)
+    FAISS_BATCH_WINDOW_MS = float(os.getenv("FAISS_BATCH_WINDOW_MS", "2"))
+    FAISS_BATCH_MAX_SIZE = int(os.getenv("FAISS_BATCH_MAX_SIZE", "64"))
+    
+    # Hybrid Search Weights (FAISS score * weight + keyword score * weight + lexical score * weight)
     FAISS_WEIGHT = float(os.getenv("FAISS_WEIGHT", "0.7"))
     KEYWORD_WEIGHT = float(os.getenv("KEYWORD_WEIGHT", "0.3"))
+    LEXICAL_WEIGHT = float(os.getenv("LEXICAL_WEIGHT", "0.3"))
+    
+    # BM25 lexical search (score 0-1 = match with one question variant)
+    LEXICAL_MIN_SCORE = float(os.getenv("LEXICAL_MIN_SCORE", "0.3"))
+    # Keyword-only mode: lexical hits below this never become LLM context (paid call)
+    LEXICAL_CONTEXT_THRESHOLD = float(os.getenv("LEXICAL_CONTEXT_THRESHOLD", "0.5"))
+    # Lexical match this close answers directly - skips embedding + LLM
+    LEXICAL_DIRECT_THRESHOLD = float(os.getenv("LEXICAL_DIRECT_THRESHOLD", "0.85"))
     
     # Embedding cost per 1M tokens
     COST_EMBEDDING_PER_1M = 0.02
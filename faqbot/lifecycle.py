@@ -9,57 +9,118 @@ from typing import Optional
 
 import redis.asyncio as redis
 from fastapi import FastAPI
+from openai import AsyncOpenAI
 
 from config import Config
 from services import (
     KnowledgeBase,
+    KBWatcher,
     FAISSIndex,
     HybridSearch,
     LLMService,
+    LLMCache,
+    RateLimiter,
+    RedisCircuitBreaker,
+    LocalRateLimiter,
+    SemanticCache,
+    create_openai_client,
 )
+from services import artifacts
 
 # Global instances
 redis_client: Optional[redis.Redis] = None
+redis_binary: Optional[redis.Redis] = None  # decode_responses=False - embedding vectors
+openai_client: Optional[AsyncOpenAI] = None
 llm_service: Optional[LLMService] = None
 faiss_index: Optional[FAISSIndex] = None
 hybrid_search: Optional[HybridSearch] = None
+kb_watcher: Optional[KBWatcher] = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan - startup and shutdown"""
-    global redis_client, llm_service, faiss_index, hybrid_search
+    global redis_client, redis_binary, openai_client, llm_service, faiss_index, hybrid_search, kb_watcher
     
     # Initialize Redis
     if os.getenv("USE_FAKE_REDIS"):
+        import fakeredis
         import fakeredis.aioredis
-        redis_client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        server = fakeredis.FakeServer()
+        redis_client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+        redis_binary = fakeredis.aioredis.FakeRedis(server=server, decode_responses=False)
         print("[WARN] Using FakeRedis (for testing only)")
     else:
         redis_client = redis.from_url(Config.REDIS_URL, decode_responses=True)
+        redis_binary = redis.from_url(Config.REDIS_URL, decode_responses=False)
+    
+    # Shared breaker - Redis-backed services fail fast while Redis is down
+    RedisCircuitBreaker.get_instance().set_redis(redis_client)
+    
+    # Rate limit Lua script - loaded once, requests send EVALSHA
+    try:
+        await RateLimiter.load_script(redis_client)
+    except Exception as e:
+        print(f"[WARN] Rate limit script not loaded ({e}), will retry on first request")
+    if Config.LOCAL_RATE_LIMIT_ENABLED:
+        LocalRateLimiter.get_instance().start(redis_client)
+    
+    # Initialize shared OpenAI client (pooled connections for LLM + embeddings)
+    openai_client = create_openai_client()
     
     # Initialize LLM Service
-    llm_service = LLMService()
+    llm_service = LLMService(openai_client)
     if llm_service.is_available():
         print(f"[INFO] LLM ready: {Config.MODEL}")
     else:
         print("[WARN] LLM not configured (OPENAI_API_KEY missing)")
     
+    # Semantic answer cache (vectors in memory, answers in Redis)
+    SemanticCache.get_instance().set_redis(redis_client)
+    
     # Load Knowledge Base
     kb = KnowledgeBase.get_instance()
+    # KB content changed → drop locally cached answers
+    kb.on_reload(lambda snapshot: LLMCache.local.set_version(snapshot.version))
     kb.load()
     
+    # Reload KB on file change (off the request path) - or on a new published artifact
+    if Config.INDEX_ARTIFACTS:
+        os.makedirs(Config.ARTIFACT_DIR, exist_ok=True)
+        kb_watcher = KBWatcher(kb, artifacts.pointer_path())
+    else:
+        kb_watcher = KBWatcher(kb)
+    kb_watcher.start()
+    
     # Initialize FAISS index
     if Config.USE_FAISS and Config.OPENAI_API_KEY:
         faiss_index = FAISSIndex.get_instance()
-        faiss_index.set_redis(redis_client)
+        faiss_index.set_openai(openai_client)
+        faiss_index.set_redis(redis_binary)
         
-        # Try to load existing index first (fast startup)
-        index_loaded = faiss_index.load()
+        if Config.INDEX_ARTIFACTS:
+            # Built offline (build_index.py) - startup is a load, never a build
+            hybrid_search = HybridSearch(kb, faiss_index)
+            artifact = kb.get_artifact()
+            if artifact and faiss_index.load_artifact(artifact):
+                print(f"[INFO] Hybrid search ready (FAISS artifact: {faiss_index.index.ntotal} vectors)")
+            else:
+                print("[WARN] No published FAISS artifact yet - keyword search until one is published")
+            # KB watcher swapped in a new artifact → swap its FAISS index too (same worker thread)
+            kb.on_reload(lambda snapshot: snapshot.artifact and faiss_index.load_artifact(snapshot.artifact))
         
-        if index_loaded:
+        # Try to load existing index first (fast startup)
+        elif faiss_index.load():
             hybrid_search = HybridSearch(kb, faiss_index)
             print(f"[INFO] Hybrid search ready (FAISS loaded: {faiss_index.index.ntotal} vectors)")
+            if faiss_index.is_outdated():
+                # One row per doc from before per-variant rows - rebuild in the background
+                # (vectors come from the embedding store; the old index serves meanwhile)
+                print("[INFO] FAISS index predates per-variant rows - scheduling a rebuild")
+                faiss_index.request_rebuild(kb.get_all_qa())
+            else:
+                # Saved index may predate KB edits - apply the diff (re-embeds changed items only)
+                asyncio.create_task(_sync_faiss(kb.get_all_qa()))
         else:
             qa_list = kb.get_all_qa()
             if qa_list:
@@ -70,25 +131,31 @@ async def lifespan(app: FastAPI):
                     hybrid_search = HybridSearch(kb, faiss_index)
                     print(f"[INFO] Hybrid search ready (FAISS built: {faiss_index.index.ntotal} vectors)")
                 else:
-                    # Large KB - build in background
+                    # Large KB - build in background (keyword search until the index is swapped in)
                     print(f"[INFO] Large KB ({len(qa_list)} items) - starting background FAISS build")
-                    hybrid_search = None
-                    
-                    async def background_build():
-                        global hybrid_search
-                        await faiss_index.build_async(qa_list)
-                        hybrid_search = HybridSearch(kb, faiss_index)
-                        print(f"[INFO] Background FAISS build complete: {faiss_index.index.ntotal} vectors")
-                    
-                    asyncio.create_task(background_build())
+                    hybrid_search = HybridSearch(kb, faiss_index)
+                    faiss_index.request_rebuild(qa_list)
             else:
                 print("[WARN] No Q&A items in KB, FAISS disabled")
+        
+        if not Config.INDEX_ARTIFACTS:
+            # KB reloads (watcher / admin) run in worker threads - hop back onto the loop
+            loop = asyncio.get_running_loop()
+            kb.on_reload(lambda snapshot: loop.call_soon_threadsafe(
+                asyncio.ensure_future, _sync_faiss(snapshot.data.get("qa", []))
+            ))
     else:
         print("[INFO] FAISS disabled, using keyword search only")
     
     yield
     
     # Shutdown
+    if kb_watcher:
+        await kb_watcher.stop()
+    await LocalRateLimiter.get_instance().stop(redis_client)
+    if openai_client:
+        await openai_client.close()
+    await redis_binary.close()
     await redis_client.close()
 
 
@@ -97,11 +164,33 @@ def get_redis():
     return redis_client
 
 
+def get_redis_binary():
+    """Get binary-safe Redis client (embedding vectors)"""
+    return redis_binary
+
+
 def get_llm_service():
     """Get LLM service instance"""
     return llm_service
 
 
+async def _sync_faiss(qa_list: list):
+    """Bring a ready FAISS index in line with the KB (no-op while a full build is pending)"""
+    if faiss_index is None or not faiss_index.is_ready():
+        return
+    if faiss_index.is_building():
+        # Queued / running rebuild (e.g. an outdated index) - fold the change into it instead
+        # of a sync that would rebuild a non-patchable index on its own
+        faiss_index.request_rebuild(qa_list)
+        return
+    try:
+        result = await faiss_index.sync(qa_list)
+        if result.get("deleted") or result.get("upserted"):
+            print(f"[INFO] FAISS synced with KB: {result}")
+    except Exception as e:
+        print(f"[ERROR] FAISS sync failed: {e}")
+
+
 def get_faiss_index():
     """Get FAISS index instance"""
     return faiss_index
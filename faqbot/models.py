@@ -16,3 +16,11 @@ class AskResponse(BaseModel):
     used_llm: bool = False
     cached: bool = False
     score: Optional[float] = None
+
+
+class FAISSUpsertRequest(BaseModel):
+    items: list[dict] = Field(..., min_length=1)
+
+
+class FAISSDeleteRequest(BaseModel):
+    ids: list[str] = Field(..., min_length=1)
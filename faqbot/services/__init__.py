@@ -2,21 +2,45 @@
 Services package
 """
 
-from .knowledge import KnowledgeBase
+from .knowledge import KnowledgeBase, RetrievalResult
+from .kb_watcher import KBWatcher
+from .batcher import EmbeddingBatcher, SearchBatcher
+from .embedding_store import EmbeddingStore
+from .doc_store import DocStore
 from .faiss_index import FAISSIndex, EmbeddingCache, HybridSearch
 from .llm import LLMService
+from .openai_client import create_openai_client
+from .local_cache import LocalCache
 from .cache import LLMCache, FreeChatCache
-from .rate_limit import RateLimiter
+from .singleflight import LLMSingleFlight
+from .semantic_cache import SemanticCache
+from .redis_breaker import RedisCircuitBreaker, CircuitOpenError
+from .rate_limit import RateLimiter, LocalRateLimiter
 from .budget import BudgetService
+from .llm_batch import LLMRequestBatch
 
 __all__ = [
     "KnowledgeBase",
+    "RetrievalResult",
+    "KBWatcher",
     "FAISSIndex",
     "EmbeddingCache",
+    "EmbeddingStore",
+    "DocStore",
+    "EmbeddingBatcher",
+    "SearchBatcher",
     "HybridSearch",
     "LLMService",
+    "create_openai_client",
+    "LocalCache",
     "LLMCache",
     "FreeChatCache",
+    "LLMSingleFlight",
+    "SemanticCache",
+    "RedisCircuitBreaker",
+    "CircuitOpenError",
     "RateLimiter",
+    "LocalRateLimiter",
     "BudgetService",
+    "LLMRequestBatch",
 ]
@@ -0,0 +1,150 @@
+"""
+Index Artifacts - versioned KB + FAISS builds, published atomically
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+from typing import Callable, Optional
+
+from config import Config
+
+
+# ARTIFACT_DIR layout:
+#   CURRENT                    name of the published artifact (temp file + rename)
+#   <version>/manifest.json    build metadata + sha256 / size of every file
+#   <version>/docs.bin         Q&A rows (DocStore) - shared by the KB and FAISS
+#   <version>/kb.pkl           keyword automaton + BM25 index + company info
+#   <version>/faiss.index      FAISS index (flat also as vectors.npy + labels.npy for mmap)
+#   .tmp-<version>/            build in progress - renamed to <version>/ once complete
+# Published directories are never modified, only pruned. kb.pkl is unpickled on
+# load - ARTIFACT_DIR must only be writable by the builder.
+MANIFEST = "manifest.json"
+POINTER = "CURRENT"
+FORMAT = 1
+
+
+def pointer_path() -> str:
+    return os.path.join(Config.ARTIFACT_DIR, POINTER)
+
+
+def current_artifact() -> Optional[str]:
+    """Directory of the published artifact, None if nothing is published"""
+    try:
+        with open(pointer_path(), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(Config.ARTIFACT_DIR, name) if name else None
+
+
+def new_version(content_version: str) -> str:
+    """Sortable artifact name: build time + KB content version"""
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}-{content_version}"
+
+
+def write_artifact(version: str, files: dict[str, Callable[[str], None]], manifest: dict) -> str:
+    """
+    Write an artifact directory and return its path (not yet published).
+    files: file name → writer(path). Everything lands in a temp directory,
+    is checksummed and fsynced, then renamed into place in one step.
+    """
+    final = os.path.join(Config.ARTIFACT_DIR, version)
+    if os.path.exists(final):
+        raise FileExistsError(f"Artifact already exists: {final}")
+    
+    tmp = os.path.join(Config.ARTIFACT_DIR, f".tmp-{version}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        checksums = {}
+        for name, writer in files.items():
+            path = os.path.join(tmp, name)
+            writer(path)
+            _fsync(path)
+            checksums[name] = {"sha256": _sha256(path), "bytes": os.path.getsize(path)}
+        
+        manifest = {**manifest, "format": FORMAT, "version": version, "created_at": time.time(), "files": checksums}
+        path = os.path.join(tmp, MANIFEST)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        _fsync(path)
+        _fsync(tmp)
+        
+        os.replace(tmp, final)
+        _fsync(Config.ARTIFACT_DIR)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return final
+
+
+def publish(path: str, keep: Optional[int] = None):
+    """Point CURRENT at an artifact (temp file + rename), then prune old ones"""
+    name = os.path.basename(os.path.normpath(path))
+    read_manifest(path, verify=False)
+    
+    tmp = f"{pointer_path()}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(name + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, pointer_path())
+    _fsync(Config.ARTIFACT_DIR)
+    
+    prune_artifacts(Config.ARTIFACT_KEEP if keep is None else keep)
+
+
+def read_manifest(path: str, verify: bool = False) -> dict:
+    """Manifest of an artifact; verify=True also checks every file's size + sha256 (ValueError on mismatch)"""
+    with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT:
+        raise ValueError(f"Unsupported artifact format {manifest.get('format')}: {path}")
+    
+    if verify:
+        for name, expected in manifest.get("files", {}).items():
+            file_path = os.path.join(path, name)
+            if not os.path.exists(file_path) or os.path.getsize(file_path) != expected["bytes"]:
+                raise ValueError(f"Artifact file missing or truncated: {file_path}")
+            if _sha256(file_path) != expected["sha256"]:
+                raise ValueError(f"Artifact checksum mismatch: {file_path}")
+    return manifest
+
+
+def prune_artifacts(keep: int):
+    """
+    Remove all but the newest `keep` artifacts (never the published one).
+    Workers still mapping a removed artifact keep their pages until they swap.
+    """
+    if not os.path.isdir(Config.ARTIFACT_DIR):
+        return
+    current = os.path.basename(current_artifact() or "")
+    names = sorted(
+        name for name in os.listdir(Config.ARTIFACT_DIR)
+        if not name.startswith(".") and os.path.isfile(os.path.join(Config.ARTIFACT_DIR, name, MANIFEST))
+    )
+    for name in names[:-keep] if keep > 0 else names:
+        if name == current:
+            continue
+        shutil.rmtree(os.path.join(Config.ARTIFACT_DIR, name), ignore_errors=True)
+        print(f"[INFO] Pruned index artifact: {name}")
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fsync(path: str):
+    """Flush a file or directory entry to disk (rename is only atomic + durable after this)"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,167 @@
+"""
+Request batching - coalesce concurrent per-request work into one batched call
+"""
+
+import asyncio
+import threading
+from typing import Any, Optional
+
+import numpy as np
+import faiss
+from openai import AsyncOpenAI
+
+from config import Config
+
+
+class MicroBatcher:
+    """
+    Base micro-batcher.
+    Queues items with a future each, flushes after `window_ms` or `max_batch` items,
+    and lets the subclass resolve the whole batch in `_send`.
+    """
+    
+    def __init__(self, window_ms: float, max_batch: int):
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._pending: list[tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+    
+    async def _submit(self, item: Any) -> Any:
+        """Queue item for the next batch and wait for its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        
+        return await future
+    
+    def _flush(self):
+        """Hand the pending batch to a background send"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, batch: list[tuple[Any, asyncio.Future]]):
+        try:
+            await self._send(batch)
+        except Exception as e:
+            self._fail(batch, e)
+        # Anything the subclass did not resolve
+        self._fail(batch, RuntimeError(f"{type(self).__name__}: result missing from batch"))
+    
+    async def _send(self, batch: list[tuple[Any, asyncio.Future]]):
+        raise NotImplementedError
+    
+    @staticmethod
+    def _fail(batch: list[tuple[Any, asyncio.Future]], error: Exception):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+
+class EmbeddingBatcher(MicroBatcher):
+    """
+    Micro-batch concurrent embedding requests.
+    Waits up to EMBEDDING_BATCH_WINDOW_MS (or until EMBEDDING_BATCH_MAX_SIZE texts)
+    then sends one embeddings.create call and fans vectors back to the callers.
+    """
+    
+    def __init__(
+        self,
+        openai_client: AsyncOpenAI,
+        window_ms: Optional[float] = None,
+        max_batch: Optional[int] = None,
+    ):
+        super().__init__(
+            Config.EMBEDDING_BATCH_WINDOW_MS if window_ms is None else window_ms,
+            Config.EMBEDDING_BATCH_MAX_SIZE if max_batch is None else max_batch,
+        )
+        self.openai = openai_client
+    
+    async def embed(self, text: str) -> np.ndarray:
+        """Get embedding for text via the next batched API call"""
+        return await self._submit(text)
+    
+    async def _send(self, batch: list[tuple[str, asyncio.Future]]):
+        # Identical texts in one window share a single input slot
+        waiters: dict[str, list[asyncio.Future]] = {}
+        for text, future in batch:
+            waiters.setdefault(text, []).append(future)
+        texts = list(waiters)
+        
+        resp = await self.openai.embeddings.create(
+            model=Config.EMBEDDING_MODEL,
+            input=texts
+        )
+        
+        if len(texts) > 1:
+            print(f"[TELEMETRY] embedding batch size={len(texts)} waiters={len(batch)}")
+        
+        for d in resp.data:
+            for future in waiters.get(texts[d.index], []):
+                # Each caller gets its own array - callers normalize in place
+                if not future.done():
+                    future.set_result(np.array(d.embedding, dtype="float32"))
+
+
+class SearchBatcher(MicroBatcher):
+    """
+    Micro-batch concurrent FAISS queries.
+    Stacks query vectors into one matrix and runs a single index.search
+    in a worker thread - BLAS-level batching, event loop never blocks on the scan.
+    lock: held around each scan so in-place index updates never race a search.
+    """
+    
+    def __init__(
+        self,
+        window_ms: Optional[float] = None,
+        max_batch: Optional[int] = None,
+        lock: Optional[threading.Lock] = None,
+    ):
+        super().__init__(
+            Config.FAISS_BATCH_WINDOW_MS if window_ms is None else window_ms,
+            Config.FAISS_BATCH_MAX_SIZE if max_batch is None else max_batch,
+        )
+        self._lock = lock or threading.Lock()
+    
+    async def search(self, index: faiss.Index, vec: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Search one (1, dim) query vector - returns (scores, indices) shaped (1, top_k)"""
+        return await self._submit((index, vec, top_k))
+    
+    async def _send(self, batch: list[tuple[tuple, asyncio.Future]]):
+        # Group by index object - a rebuild may swap the index mid-window
+        groups: dict[int, list[tuple[tuple, asyncio.Future]]] = {}
+        for entry in batch:
+            groups.setdefault(id(entry[0][0]), []).append(entry)
+        
+        for group in groups.values():
+            index = group[0][0][0]
+            matrix = np.vstack([item[1] for item, _ in group]).astype("float32", copy=False)
+            max_k = max(item[2] for item, _ in group)
+            
+            try:
+                scores, indices = await asyncio.to_thread(self._scan, index, matrix, max_k)
+            except Exception as e:
+                self._fail(group, e)
+                continue
+            
+            for row, ((_, _, top_k), future) in enumerate(group):
+                if not future.done():
+                    future.set_result((scores[row:row + 1, :top_k], indices[row:row + 1, :top_k]))
+    
+    def _scan(self, index: faiss.Index, matrix: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            return index.search(matrix, k)
@@ -3,11 +3,11 @@ Budget Service - Track and limit daily LLM spend
 """
 
 import time
-import asyncio
 
 import redis.asyncio as redis
 
 from config import Config
+from .redis_breaker import redis_call
 
 
 class BudgetService:
@@ -19,26 +19,52 @@ class BudgetService:
     def _today_key(self) -> str:
         return f"budget:{time.strftime('%Y-%m-%d')}"
     
+    async def _read_today_cost(self) -> float:
+        """Today's cost - raises if Redis is unavailable"""
+        cost = await redis_call(self.redis.get(self._today_key()), timeout=2.0)
+        return self.parse_cost(cost)
+    
     async def get_today_cost(self) -> float:
         """Get today's total cost in USD"""
         try:
-            cost = await asyncio.wait_for(self.redis.get(self._today_key()), timeout=2.0)
-            return float(cost) if cost else 0.0
+            return await self._read_today_cost()
         except Exception:
             return 0.0
     
+    @staticmethod
+    def cost_of(input_tokens: int, output_tokens: int) -> float:
+        """USD cost of one LLM call"""
+        cost = (input_tokens / 1_000_000) * Config.COST_INPUT_PER_1M
+        cost += (output_tokens / 1_000_000) * Config.COST_OUTPUT_PER_1M
+        return cost
+    
+    # Batched API - queue commands on a caller-owned pipeline (see LLMRequestBatch)
+    
+    def queue_today_cost(self, pipe):
+        """Queue GET of today's cost - parse the reply with parse_cost()"""
+        pipe.get(self._today_key())
+    
+    @staticmethod
+    def parse_cost(raw) -> float:
+        return float(raw) if raw else 0.0
+    
+    def queue_add_cost(self, pipe, input_tokens: int, output_tokens: int):
+        """Queue INCRBYFLOAT + EXPIRE (use a MULTI pipeline so the key always gets a TTL)"""
+        key = self._today_key()
+        pipe.incrbyfloat(key, self.cost_of(input_tokens, output_tokens))
+        pipe.expire(key, 86400)
+    
     async def add_cost(self, input_tokens: int, output_tokens: int):
         """Add cost from LLM call"""
         try:
-            cost = (input_tokens / 1_000_000) * Config.COST_INPUT_PER_1M
-            cost += (output_tokens / 1_000_000) * Config.COST_OUTPUT_PER_1M
+            cost = self.cost_of(input_tokens, output_tokens)
             
             key = self._today_key()
-            current = await asyncio.wait_for(self.redis.incrbyfloat(key, cost), timeout=2.0)
+            current = await redis_call(self.redis.incrbyfloat(key, cost), timeout=2.0)
             
-            ttl = await self.redis.ttl(key)
+            ttl = await redis_call(self.redis.ttl(key), timeout=2.0)
             if ttl == -1:
-                await self.redis.expire(key, 86400)
+                await redis_call(self.redis.expire(key, 86400), timeout=2.0)
             
             return current
         except Exception:
@@ -47,7 +73,7 @@ class BudgetService:
     async def is_budget_exceeded(self) -> bool:
         """Check if daily budget exceeded - FAIL CLOSED"""
         try:
-            cost = await self.get_today_cost()
+            cost = await self._read_today_cost()
             return cost >= Config.DAILY_BUDGET_USD
         except Exception:
             print("[WARN] Redis unavailable, blocking LLM (fail closed)")
@@ -56,7 +82,7 @@ class BudgetService:
     async def get_status(self) -> dict:
         """Get budget status"""
         try:
-            cost = await self.get_today_cost()
+            cost = await self._read_today_cost()
             return {
                 "today_cost_usd": round(cost, 4),
                 "daily_budget_usd": Config.DAILY_BUDGET_USD,
@@ -2,6 +2,7 @@
 Caching services for LLM responses
 """
 
+import time
 import asyncio
 import hashlib
 from typing import Optional
@@ -9,50 +10,137 @@ from typing import Optional
 import redis.asyncio as redis
 
 from config import Config
+from .redis_breaker import redis_call
+from .local_cache import LocalCache
 
 
 class LLMCache:
     """
     Cache LLM responses with context-aware keys.
-    Uses hash(question + context) to prevent semantic collisions.
+    Uses hash(question + context fingerprint) to prevent semantic collisions.
+    The fingerprint is the ordered (doc_id, doc_version) list of the context docs
+    (RetrievalResult.context_key) - editing a doc only invalidates entries that used it.
     """
     
+    # Stats are maintained incrementally - /api/status never scans keys
+    STATS_LOOKUPS = "llm_stats:lookups"
+    STATS_HITS = "llm_stats:hits"
+    STATS_SETS = "llm_stats:sets"
+    STATS_QUESTIONS = "llm_stats:questions"  # HyperLogLog of normalized questions
+    STATS_INDEX = "llm_stats:index"          # zset: cache key → expiry time
+    # Hits per tier: local (in-process) / redis / semantic (paraphrase) / coalesced (single-flight)
+    STATS_TIER_HITS = "llm_stats:hits:"
+    HIT_TIERS = ("local", "redis", "semantic", "coalesced")
+    
+    # Fire-and-forget stat writes (keep references until done)
+    _background: set = set()
+    
+    # In-process tier keyed by the Redis key; versioned by KB content (set on reload)
+    local = LocalCache(
+        "answer_local",
+        int(Config.LOCAL_CACHE_ANSWER_MB * 1024 * 1024),
+        min(Config.LOCAL_CACHE_TTL, Config.LLM_CACHE_TTL),
+    )
+    
     def __init__(self, redis_client: redis.Redis):
         self.redis = redis_client
     
-    def _hash_key(self, question: str, context: str = "") -> str:
-        """Create hash key from question + context"""
+    def key_for(self, question: str, context_key: str = "") -> str:
+        """Redis key of an answer: hash of question + context fingerprint (also keys single-flight + semantic cache)"""
         q_norm = question.lower().strip()
-        c_norm = context[:200].lower().strip() if context else ""
-        combined = f"{q_norm}|{c_norm}"
+        combined = f"{q_norm}|{context_key}"
         return f"llm_cache:{hashlib.sha1(combined.encode()).hexdigest()}"
     
-    async def get(self, question: str, context: str = "") -> Optional[str]:
-        """Get cached answer"""
+    async def get(self, question: str, context_key: str = "") -> Optional[str]:
+        """Get cached answer (local tier first)"""
+        key = self.key_for(question, context_key)
+        answer = self.local.get(key)
+        if answer is not None:
+            return answer
         try:
-            key = self._hash_key(question, context)
-            return await asyncio.wait_for(self.redis.get(key), timeout=2.0)
+            answer = await redis_call(self.redis.get(key), timeout=2.0)
         except Exception:
             return None
+        if answer:
+            self.local.set(key, answer)
+        return answer
     
-    async def set(self, question: str, answer: str, context: str = ""):
+    async def set(self, question: str, answer: str, context_key: str = ""):
         """Cache answer"""
         try:
-            key = self._hash_key(question, context)
-            await asyncio.wait_for(
-                self.redis.setex(key, Config.LLM_CACHE_TTL, answer),
-                timeout=2.0
-            )
+            pipe = self.redis.pipeline(transaction=True)
+            self.queue_set(pipe, question, answer, context_key)
+            await redis_call(pipe.execute(), timeout=2.0)
         except Exception:
             pass
     
+    # Batched API - queue commands on a caller-owned pipeline (see LLMRequestBatch)
+    
+    def queue_get(self, pipe, question: str, context_key: str = ""):
+        """Queue GET + lookup stats - the GET reply comes first"""
+        pipe.get(self.key_for(question, context_key))
+        pipe.incr(self.STATS_LOOKUPS)
+        pipe.pfadd(self.STATS_QUESTIONS, question.lower().strip())
+    
+    def queue_set(self, pipe, question: str, answer: str, context_key: str = ""):
+        key = self.key_for(question, context_key)
+        self.local.set(key, answer)  # write-through
+        pipe.setex(key, Config.LLM_CACHE_TTL, answer)
+        pipe.incr(self.STATS_SETS)
+        # Size index trimmed on write - bounded by live entries even if nothing reads the stats
+        now = time.time()
+        pipe.zremrangebyscore(self.STATS_INDEX, "-inf", now)
+        pipe.zadd(self.STATS_INDEX, {key: now + Config.LLM_CACHE_TTL})
+        # Every member expires by then - no writes, no index
+        pipe.expire(self.STATS_INDEX, Config.LLM_CACHE_TTL)
+    
+    def record_hit(self, tier: str = "redis", question: Optional[str] = None):
+        """
+        Count a cache hit without delaying the response.
+        question: the lookup never reached Redis (local tier) - count the lookup too.
+        """
+        async def incr():
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                if question is not None:
+                    pipe.incr(self.STATS_LOOKUPS)
+                    pipe.pfadd(self.STATS_QUESTIONS, question.lower().strip())
+                pipe.incr(self.STATS_HITS)
+                pipe.incr(self.STATS_TIER_HITS + tier)
+                await redis_call(pipe.execute(), timeout=2.0)
+            except Exception:
+                pass
+        
+        task = asyncio.create_task(incr())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+    
     async def get_stats(self) -> dict:
-        """Get cache stats"""
+        """Get cache stats - counters + HLL + zset cardinality, one round trip"""
         try:
-            keys = await asyncio.wait_for(self.redis.keys("llm_cache:*"), timeout=2.0)
-            return {"cached_answers": len(keys)}
+            pipe = self.redis.pipeline(transaction=False)
+            # Drop entries expired since the last cache write - exact count on read
+            pipe.zremrangebyscore(self.STATS_INDEX, "-inf", time.time())
+            pipe.zcard(self.STATS_INDEX)
+            pipe.mget(self.STATS_LOOKUPS, self.STATS_HITS, self.STATS_SETS)
+            pipe.mget(*(self.STATS_TIER_HITS + tier for tier in self.HIT_TIERS))
+            pipe.pfcount(self.STATS_QUESTIONS)
+            _, size, counters, tiers, unique = await redis_call(pipe.execute(), timeout=2.0)
+            
+            lookups, hits, sets = (int(x or 0) for x in counters)
+            return {
+                **self.local.get_stats(),
+                "cached_answers": size,
+                "lookups": lookups,
+                "hits": hits,
+                "misses": max(0, lookups - hits),
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "hits_by_tier": {tier: int(x or 0) for tier, x in zip(self.HIT_TIERS, tiers)},
+                "sets": sets,
+                "unique_questions": unique,
+            }
         except Exception:
-            return {"cached_answers": 0}
+            return {**self.local.get_stats(), "cached_answers": 0}
 
 
 class FreeChatCache:
@@ -69,7 +157,7 @@ class FreeChatCache:
         """Get cached answer"""
         try:
             key = self._hash_question(question)
-            return await asyncio.wait_for(self.redis.get(key), timeout=2.0)
+            return await redis_call(self.redis.get(key), timeout=2.0)
         except Exception:
             return None
     
@@ -77,7 +165,7 @@ class FreeChatCache:
         """Cache answer with short TTL"""
         try:
             key = self._hash_question(question)
-            await asyncio.wait_for(
+            await redis_call(
                 self.redis.setex(key, Config.FREE_CHAT_CACHE_TTL, answer),
                 timeout=2.0
             )
@@ -0,0 +1,152 @@
+"""
+Doc Store - memory-mapped columnar Q&A storage shared across worker processes
+"""
+
+import os
+import json
+import mmap
+import glob
+import struct
+from typing import Any, Iterable, Iterator, Optional
+
+import numpy as np
+
+from config import Config
+
+
+# File layout:
+#   magic (8) | header length (uint32) | header JSON | pad to 8
+#   offsets: uint64[rows * columns + 1] | UTF-8 blob
+# Cell = b"" (field absent) | b"s" + text | b"j" + JSON (non-string values)
+_MAGIC = b"FAQDOCS1"
+_HEADER_LEN = struct.Struct("<I")
+_STR = ord("s")
+_JSON = ord("j")
+
+
+class DocStore:
+    """
+    Read-only, memory-mapped list of Q&A dicts.
+    Rows are decoded on access; nothing is parsed at open time, and every
+    process mapping the same file shares one copy in the page cache.
+    Rows round-trip exactly (missing fields stay missing), so doc versions match.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        if self._mm[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"Not a doc store: {path}")
+        (header_len,) = _HEADER_LEN.unpack_from(self._mm, len(_MAGIC))
+        start = len(_MAGIC) + _HEADER_LEN.size
+        header = json.loads(self._mm[start:start + header_len])
+        
+        self.columns: list[str] = header["columns"]
+        self.meta: dict = header.get("meta", {})
+        self._rows = header["rows"]
+        self._col = {name: i for i, name in enumerate(self.columns)}
+        
+        offsets_at = _align(start + header_len)
+        cells = self._rows * len(self.columns)
+        self._offsets = np.frombuffer(self._mm, dtype="<u8", count=cells + 1, offset=offsets_at)
+        self._blob_at = offsets_at + self._offsets.nbytes
+    
+    @staticmethod
+    def write(path: str, rows: Iterable[dict], meta: Optional[dict] = None):
+        """Write rows atomically (temp file + rename - readers keep their old mapping)"""
+        rows = list(rows)
+        columns: dict[str, None] = {}
+        for row in rows:
+            columns.update(dict.fromkeys(row))
+        columns = list(columns)
+        
+        blob = bytearray()
+        offsets = [0]
+        for row in rows:
+            for name in columns:
+                if name in row:
+                    value = row[name]
+                    if isinstance(value, str):
+                        blob += b"s" + value.encode("utf-8")
+                    else:
+                        blob += b"j" + json.dumps(value, ensure_ascii=False).encode("utf-8")
+                offsets.append(len(blob))
+        
+        header = json.dumps({"columns": columns, "rows": len(rows), "meta": meta or {}}).encode()
+        prefix = _MAGIC + _HEADER_LEN.pack(len(header)) + header
+        prefix += b"\0" * (_align(len(prefix)) - len(prefix))
+        
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Per-process temp name - several workers may write the same store at startup
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(prefix)
+            f.write(np.asarray(offsets, dtype="<u8").tobytes())
+            f.write(blob)
+        os.replace(tmp, path)
+    
+    def __len__(self) -> int:
+        return self._rows
+    
+    def __getitem__(self, i: int) -> dict:
+        if not -self._rows <= i < self._rows:
+            raise IndexError(i)
+        i %= self._rows
+        row = {}
+        for c, name in enumerate(self.columns):
+            cell = self._cell(i, c)
+            if cell is not None:
+                row[name] = cell
+        return row
+    
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(self._rows):
+            yield self[i]
+    
+    def get(self, i: int, column: str, default: Any = None) -> Any:
+        """One field without decoding the whole row"""
+        c = self._col.get(column)
+        if c is None:
+            return default
+        cell = self._cell(i, c)
+        return default if cell is None else cell
+    
+    def column(self, name: str) -> list:
+        return [self.get(i, name) for i in range(self._rows)]
+    
+    def _cell(self, i: int, c: int) -> Any:
+        k = i * len(self.columns) + c
+        start, end = int(self._offsets[k]), int(self._offsets[k + 1])
+        if start == end:
+            return None
+        raw = self._mm[self._blob_at + start + 1:self._blob_at + end]
+        if self._mm[self._blob_at + start] == _STR:
+            return raw.decode("utf-8")
+        return json.loads(raw)
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def shared_doc_store(name: str, rows: list[dict], meta: Optional[dict] = None) -> DocStore:
+    """
+    Open DOC_STORE_DIR/{name}.bin, writing it first if no worker has yet.
+    `name` must identify the content (e.g. include a content version).
+    """
+    path = os.path.join(Config.DOC_STORE_DIR, f"{name}.bin")
+    if not os.path.exists(path):
+        DocStore.write(path, rows, meta)
+    return DocStore(path)
+
+
+def prune_doc_stores(prefix: str, keep: str):
+    """Remove older {prefix}*.bin files (workers still mapping them keep their pages)"""
+    for path in glob.glob(os.path.join(Config.DOC_STORE_DIR, f"{prefix}*.bin")):
+        if os.path.basename(path) != f"{keep}.bin":
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,179 @@
+"""
+Embedding Store - persistent content-addressed embeddings for index builds
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+from typing import Optional
+
+import numpy as np
+
+
+class EmbeddingStore:
+    """
+    On-disk embeddings keyed by hash(model, text), one store per model.
+    {model}.*.npy: float32 (rows, dim) segments, opened memory-mapped
+    {model}.keys.json: segment list + row → key list (the hash index is rebuilt from it on load)
+    Rows are only appended: add() writes one new segment, never touching the
+    existing ones, so checkpoints cost the new rows only. Segments are merged
+    once there are more than MAX_SEGMENTS; compact() drops rows no longer referenced.
+    Writes go to a temp file + rename, segment before keys, so a crash leaves
+    the old keys (and at worst an orphaned segment file).
+    Not locked - writers are serialized by the caller (FAISSIndex holds its index file lock).
+    """
+    
+    MAX_SEGMENTS = 32
+    
+    def __init__(self, directory: str, model: str):
+        self.model = model
+        self.directory = directory
+        self.slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        self.keys_path = os.path.join(directory, f"{self.slug}.keys.json")
+        self._segments: list[str] = []       # file names, in row order
+        self._vectors: list[np.ndarray] = []  # memory-mapped segments
+        self._starts = np.zeros(1, dtype="int64")  # first row of each segment (+ total)
+        self._keys: list[str] = []
+        self._rows: dict[str, int] = {}
+    
+    def key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model}\n{text}".encode()).hexdigest()
+    
+    @property
+    def dim(self) -> Optional[int]:
+        return self._vectors[0].shape[1] if self._vectors else None
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+    
+    def load(self):
+        """Open the segments memory-mapped and rebuild the hash index"""
+        self._reset()
+        if not os.path.exists(self.keys_path):
+            return
+        try:
+            with open(self.keys_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            # Single-file layout from before segments: {model}.npy
+            segments = meta.get("segments", [f"{self.slug}.npy"])
+            vectors = [np.load(os.path.join(self.directory, name), mmap_mode="r") for name in segments]
+            keys = meta.get("keys", [])
+            total = sum(len(v) for v in vectors)
+            if (meta.get("model") != self.model or len(keys) > total
+                    or any(v.ndim != 2 or v.shape[1] != vectors[0].shape[1] for v in vectors)):
+                print(f"[WARN] Embedding store mismatch, starting fresh: {self.keys_path}")
+                return
+            self._segments = segments
+            self._vectors = vectors
+            self._starts = np.cumsum([0] + [len(v) for v in vectors]).astype("int64")
+            self._keys = keys
+            self._rows = {k: i for i, k in enumerate(keys)}
+        except Exception as e:
+            print(f"[WARN] Failed to load embedding store: {e}")
+            self._reset()
+    
+    def lookup(self, texts: list[str]) -> tuple[Optional[np.ndarray], list[int]]:
+        """
+        Returns (matrix with stored rows filled in, positions still missing).
+        The matrix is a fresh array (safe to normalize in place); None if nothing is stored yet.
+        """
+        rows = [self._rows.get(self.key(t)) for t in texts]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if not self._vectors:
+            return None, list(range(len(texts)))
+        
+        matrix = np.zeros((len(texts), self.dim), dtype="float32")
+        found = [i for i, row in enumerate(rows) if row is not None]
+        if found:
+            matrix[found] = self._gather([rows[i] for i in found])
+        return matrix, missing
+    
+    def add(self, texts: list[str], vectors: np.ndarray):
+        """Append new embeddings as one segment (skips texts already stored)"""
+        vectors = np.asarray(vectors, dtype="float32")
+        if self._vectors and vectors.shape[1] != self.dim:
+            # Same model name, different dimension - old rows are useless
+            print(f"[WARN] Embedding dim changed ({self.dim} -> {vectors.shape[1]}), resetting store")
+            self._write([], [], self._segments)
+        
+        new_keys, new_rows, seen = [], [], set()
+        for text, vec in zip(texts, vectors):
+            key = self.key(text)
+            if key in self._rows or key in seen:
+                continue
+            seen.add(key)
+            new_keys.append(key)
+            new_rows.append(vec)
+        if not new_keys:
+            return
+        
+        name = self._write_segment(np.stack(new_rows))
+        if len(self._segments) + 1 > self.MAX_SEGMENTS:
+            # Many small checkpoints / upserts - fold everything into one segment
+            live = self._vectors + [np.load(os.path.join(self.directory, name), mmap_mode="r")]
+            merged = self._write_segment(np.concatenate([np.asarray(v) for v in live]))
+            self._write([merged], self._keys + new_keys, self._segments + [name])
+        else:
+            self._write(self._segments + [name], self._keys + new_keys, [])
+    
+    def garbage(self, live_texts: list[str]) -> int:
+        """Rows not referenced by `live_texts`"""
+        live = {self.key(t) for t in live_texts}
+        return sum(1 for k in self._keys if k not in live)
+    
+    def compact(self, live_texts: list[str]) -> int:
+        """Drop rows not referenced by `live_texts` (rewrites one segment). Returns rows removed"""
+        if not self._vectors:
+            return 0
+        live = {self.key(t) for t in live_texts}
+        keep = [i for i, k in enumerate(self._keys) if k in live]
+        removed = len(self._keys) - len(keep)
+        if removed:
+            name = self._write_segment(self._gather(keep))
+            self._write([name], [self._keys[i] for i in keep], self._segments)
+        return removed
+    
+    def _gather(self, rows: list[int]) -> np.ndarray:
+        """Stored vectors by row number - one fancy-index read per segment, only the needed pages are touched"""
+        rows = np.asarray(rows, dtype="int64")
+        matrix = np.empty((len(rows), self.dim), dtype="float32")
+        segment_of = np.searchsorted(self._starts, rows, side="right") - 1
+        for s in np.unique(segment_of):
+            hit = segment_of == s
+            matrix[hit] = self._vectors[s][rows[hit] - self._starts[s]]
+        return matrix
+    
+    def _reset(self):
+        self._segments, self._vectors, self._keys, self._rows = [], [], [], {}
+        self._starts = np.zeros(1, dtype="int64")
+    
+    def _write_segment(self, vectors: np.ndarray) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        # Unique per writer - segments are immutable once named
+        name = f"{self.slug}.{time.time_ns()}-{os.getpid()}.npy"
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, vectors)
+        os.replace(tmp, path)
+        return name
+    
+    def _write(self, segments: list[str], keys: list[str], obsolete: list[str]):
+        """Publish a new segment list + keys, then delete segments it no longer references"""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{self.keys_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model, "segments": segments, "keys": keys}, f)
+        os.replace(tmp, self.keys_path)
+        
+        # Drop our mappings before unlinking (other readers keep their pages)
+        self._reset()
+        for name in set(obsolete) - set(segments):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        
+        self.load()
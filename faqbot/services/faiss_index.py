@@ -3,36 +3,56 @@ FAISS Vector Index with Hybrid Search (semantic + keyword)
 """
 
 import os
-import gc
+import time
 import json
-import base64
 import hashlib
+import fcntl
+import random
 import asyncio
-from typing import Optional
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, Optional
 
 import numpy as np
 import faiss
-from openai import OpenAI
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError
 
 from config import Config
-from .knowledge import KnowledgeBase
+from .redis_breaker import redis_call
+from .knowledge import KnowledgeBase, RetrievalResult, assign_doc_ids
+from .batcher import EmbeddingBatcher, SearchBatcher
+from .local_cache import LocalCache
+from .vector_codec import encode_vector, decode_vector
+from .embedding_store import EmbeddingStore
+from .doc_store import DocStore
+from . import artifacts
+from .index_factory import FLAT, REMOVABLE, choose_index_type, create_index, tune, measure_recall
 
 
 class EmbeddingCache:
     """
     Cache embeddings in Redis to avoid repeated OpenAI API calls.
-    Stores as binary (base64) for efficiency - 5x faster, 40% less RAM.
+    Stores raw bytes (EMBEDDING_CACHE_DTYPE: float32 / float16 / int8) on a
+    binary-safe Redis connection - ~3 KB per 1536-dim vector at float16.
+    Hot queries are served from an in-process tier (decoded arrays, versioned by model).
     """
     
-    def __init__(self, redis_client, openai_client):
+    local = LocalCache(
+        "embedding_local",
+        int(Config.LOCAL_CACHE_EMBEDDING_MB * 1024 * 1024),
+        Config.LOCAL_CACHE_TTL,
+        version=Config.EMBEDDING_MODEL,
+    )
+    
+    def __init__(self, redis_client, openai_client, batcher: Optional[EmbeddingBatcher] = None):
         self.redis = redis_client
         self.openai = openai_client
+        self.batcher = batcher
         self.ttl = 86400  # 24 hours
         self._detected_dim = None
     
     def _cache_key(self, text: str) -> str:
         normalized = text.lower().strip()
-        return f"emb_cache:{hashlib.sha1(normalized.encode()).hexdigest()}"
+        return f"emb_vec:{hashlib.sha1(normalized.encode()).hexdigest()}"
     
     async def get_or_embed(self, text: str) -> Optional[np.ndarray]:
         """
@@ -45,14 +65,21 @@ class EmbeddingCache:
         
         key = self._cache_key(text)
         
+        # Local tier - no network, no decode (copy: callers normalize in place)
+        vec = self.local.get(key)
+        if vec is not None:
+            return vec.copy()
+        
         # Try cache first
         redis_available = False
         try:
-            cached = await asyncio.wait_for(self.redis.get(key), timeout=1.0)
+            cached = await redis_call(self.redis.get(key), timeout=1.0)
             redis_available = True
             if cached:
-                binary = base64.b64decode(cached)
-                return np.frombuffer(binary, dtype="float32").copy()
+                vec = decode_vector(cached)
+                # Local tier keeps the (read-only) decoded array; callers get a copy
+                self.local.set(key, vec)
+                return vec.copy()
         except Exception as e:
             # Redis failed - FAIL CLOSED to prevent runaway costs
             print(f"[WARN] EmbeddingCache Redis error: {e} - skipping embedding (fail closed)")
@@ -62,23 +89,26 @@ class EmbeddingCache:
         if not self.openai:
             raise ValueError("OpenAI client not configured")
         
-        resp = await asyncio.to_thread(
-            self.openai.embeddings.create,
-            model=Config.EMBEDDING_MODEL,
-            input=[text]
-        )
-        vec = np.array(resp.data[0].embedding, dtype="float32")
+        if self.batcher:
+            # Coalesced with other concurrent misses into one API call
+            vec = await self.batcher.embed(text)
+        else:
+            resp = await self.openai.embeddings.create(
+                model=Config.EMBEDDING_MODEL,
+                input=[text]
+            )
+            vec = np.array(resp.data[0].embedding, dtype="float32")
         
         # Auto-detect dimension
         if self._detected_dim is None:
             self._detected_dim = len(vec)
             print(f"[INFO] Detected embedding dimension: {self._detected_dim}")
         
-        # Cache result
+        # Cache result (write-through: local + Redis)
+        self.local.set(key, vec.copy())
         try:
-            b64 = base64.b64encode(vec.tobytes()).decode("ascii")
-            await asyncio.wait_for(
-                self.redis.setex(key, self.ttl, b64),
+            await redis_call(
+                self.redis.setex(key, self.ttl, encode_vector(vec, Config.EMBEDDING_CACHE_DTYPE)),
                 timeout=1.0
             )
         except Exception:
@@ -87,27 +117,205 @@ class EmbeddingCache:
         
         return vec
     
-    def embed_sync(self, texts: list[str]) -> tuple[np.ndarray, int]:
-        """Synchronous batch embedding for index building"""
+    async def embed_batch(
+        self,
+        texts: list[str],
+        on_batch: Optional[Callable[[list[int], np.ndarray], Awaitable[None]]] = None,
+        progress: Optional[dict] = None,
+    ) -> tuple[np.ndarray, int]:
+        """
+        Batch embedding for index building.
+        Token-aware batches, EMBEDDING_BUILD_CONCURRENCY requests in flight,
+        429 / 5xx / network errors retried with exponential backoff.
+        on_batch(positions, vectors): awaited as each batch lands (checkpointing).
+        progress: dict updated in place - done / batches / retries.
+        """
         if not self.openai:
             raise ValueError("OpenAI client not configured")
         
-        all_embeddings = []
-        batch_size = 100
-        detected_dim = None
+        # Retries are ours (backoff + Retry-After) - none stacked inside the client
+        client = self.openai.with_options(max_retries=0)
+        batches = embedding_batches(texts)
+        results: list[Optional[np.ndarray]] = [None] * len(batches)
+        semaphore = asyncio.Semaphore(max(1, Config.EMBEDDING_BUILD_CONCURRENCY))
+        progress = progress if progress is not None else {}
+        for key in ("done", "batches", "retries"):
+            progress.setdefault(key, 0)
         
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            resp = self.openai.embeddings.create(
-                model=Config.EMBEDDING_MODEL,
-                input=batch
-            )
-            all_embeddings.extend([d.embedding for d in resp.data])
-            
-            if detected_dim is None and resp.data:
-                detected_dim = len(resp.data[0].embedding)
+        async def run(b: int, positions: list[int]):
+            async with semaphore:
+                resp = await self._embed_with_retry(client, [texts[i] for i in positions], progress)
+                vectors = np.array([d.embedding for d in resp.data], dtype="float32")
+                results[b] = vectors
+                progress["done"] += len(positions)
+                progress["batches"] += 1
+                if on_batch is not None:
+                    await on_batch(positions, vectors)
+        
+        tasks = [asyncio.create_task(run(b, positions)) for b, positions in enumerate(batches)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # One batch gave up - stop the rest (finished batches were already checkpointed)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        
+        if not results:
+            return np.zeros((0, Config.EMBEDDING_DIM), dtype="float32"), Config.EMBEDDING_DIM
+        vectors = np.concatenate(results)
+        # Batches hold ascending positions in order - concatenation is already in text order
+        return vectors, vectors.shape[1]
+    
+    @staticmethod
+    async def _embed_with_retry(client: AsyncOpenAI, batch: list[str], progress: dict):
+        for attempt in range(Config.EMBEDDING_BUILD_MAX_RETRIES + 1):
+            try:
+                return await client.embeddings.create(model=Config.EMBEDDING_MODEL, input=batch)
+            except (APIStatusError, APIConnectionError) as e:
+                status = getattr(e, "status_code", None)
+                retryable = status is None or status == 429 or status >= 500
+                if not retryable or attempt == Config.EMBEDDING_BUILD_MAX_RETRIES:
+                    raise
+                
+                # Exponential backoff with full jitter; honour Retry-After when the API sends one
+                cap = min(Config.EMBEDDING_BUILD_BACKOFF_MAX, Config.EMBEDDING_BUILD_BACKOFF * 2 ** attempt)
+                delay = random.uniform(0, cap)
+                retry_after = e.response.headers.get("retry-after") if isinstance(e, APIStatusError) else None
+                try:
+                    delay = max(delay, min(float(retry_after), Config.EMBEDDING_BUILD_BACKOFF_MAX))
+                except (TypeError, ValueError):
+                    pass
+                
+                progress["retries"] += 1
+                print(f"[WARN] Embedding batch failed ({status or type(e).__name__}), "
+                      f"retry {attempt + 1}/{Config.EMBEDDING_BUILD_MAX_RETRIES} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+
+def estimate_tokens(text: str) -> int:
+    """Upper bound on embedding tokens - byte-level BPE never emits more tokens than UTF-8 bytes"""
+    return len(text.encode("utf-8")) + 1
+
+
+def embedding_batches(texts: list[str]) -> list[list[int]]:
+    """Split positions into API requests capped by input count and estimated tokens"""
+    batches, current, tokens = [], [], 0
+    for i, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if current and (len(current) >= Config.EMBEDDING_BUILD_BATCH_SIZE
+                        or tokens + cost > Config.EMBEDDING_BUILD_BATCH_TOKENS):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(i)
+        tokens += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def file_sha1(path: str) -> str:
+    """Content stamp pairing saved files (index ↔ docs) - see FAISSIndex._save"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def faiss_id(doc_id: str) -> int:
+    """Stable int64 FAISS label for a doc id (60-bit hash)"""
+    return int(hashlib.sha1(doc_id.encode()).hexdigest()[:15], 16)
+
+
+# Vector rows per doc: label = faiss_id(doc id) << VARIANT_BITS | slot
+# Slots 0-2: q / q_en / q_ja, 3-7: optional "paraphrases"
+VARIANT_BITS = 3
+VARIANT_FIELDS = ("q", "q_en", "q_ja")
+MAX_PARAPHRASES = (1 << VARIANT_BITS) - len(VARIANT_FIELDS)
+
+
+def embedding_texts(qa: dict) -> list[tuple[int, str]]:
+    """
+    (slot, text) rows embedded for a Q&A item - one per question variant, so a
+    single-language query meets its own language instead of a diluted mix.
+    Keywords are for keyword search only (they pollute semantic meaning).
+    """
+    variants = [qa.get(field) for field in VARIANT_FIELDS]
+    variants += list(qa.get("paraphrases") or [])[:MAX_PARAPHRASES]
+    return [(slot, text.strip()) for slot, text in enumerate(variants) if isinstance(text, str) and text.strip()]
+
+
+def variant_name(slot: int) -> str:
+    return VARIANT_FIELDS[slot] if slot < len(VARIANT_FIELDS) else f"paraphrase_{slot - len(VARIANT_FIELDS) + 1}"
+
+
+class MmapFlatIndex:
+    """
+    Read-only inner-product index over a memory-mapped (ntotal, d) float32 matrix.
+    FAISS 1.7 reads flat indexes into the heap even with IO_FLAG_MMAP; a numpy
+    matmul over np.load(mmap_mode="r") scans the shared page cache instead.
+    Same search() contract as a FAISS index (missing results: label -1).
+    """
+    
+    def __init__(self, vectors: np.ndarray, labels: np.ndarray):
+        self.vectors = vectors
+        self.labels = labels
+        self.ntotal, self.d = vectors.shape
+    
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        scores = queries @ self.vectors.T
+        out_scores = np.full((len(queries), k), -np.finfo("float32").max, dtype="float32")
+        out_labels = np.full((len(queries), k), -1, dtype="int64")
         
-        return np.array(all_embeddings, dtype="float32"), detected_dim or Config.EMBEDDING_DIM
+        top_k = min(k, self.ntotal)
+        if top_k:
+            top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            out_scores[:, :top_k] = np.take_along_axis(top_scores, order, axis=1)
+            out_labels[:, :top_k] = self.labels[np.take_along_axis(top, order, axis=1)]
+        return out_scores, out_labels
+    
+    def to_faiss(self) -> faiss.Index:
+        """Writable in-memory copy (upsert / delete)"""
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.d))
+        index.add_with_ids(np.ascontiguousarray(self.vectors, dtype="float32"), np.asarray(self.labels))
+        return index
+
+
+class IndexSnapshot:
+    """
+    One published FAISS index + the docs it was built from.
+    Swapped in with a single reference assignment - a query that took a
+    snapshot keeps using it even if a rebuild lands mid-search.
+    docs: list of dicts, or a DocStore in MMAP_SERVING mode.
+    info: index type + build-time recall (saved with the docs metadata).
+    Indexes without info["variant_bits"] predate per-variant rows - one row per doc.
+    read_only: index is memory-mapped - never mutate it in place.
+    """
+    
+    def __init__(self, index, docs, dim: int, info: Optional[dict] = None, read_only: bool = False):
+        self.index = index
+        self.docs = docs
+        self.dim = dim
+        self.info = info or {"index_type": FLAT}
+        self.read_only = read_only
+        self.variant_bits = self.info.get("variant_bits", 0)
+        # FAISS label → doc row (sorted labels + binary search: 16 B/doc, no per-doc objects)
+        ids = docs.column("id") if isinstance(docs, DocStore) else [d["id"] for d in docs]
+        labels = np.array([faiss_id(i) for i in ids], dtype="int64")
+        self._order = np.argsort(labels)
+        self._sorted = labels[self._order]
+    
+    def doc(self, label: int) -> Optional[dict]:
+        """Parent doc of a vector row"""
+        label >>= self.variant_bits
+        pos = int(np.searchsorted(self._sorted, label))
+        if pos < len(self._sorted) and self._sorted[pos] == label:
+            return self.docs[int(self._order[pos])]
+        return None
 
 
 class FAISSIndex:
@@ -116,12 +324,32 @@ class FAISSIndex:
     _instance = None
     
     def __init__(self):
-        self.index = None
-        self.docs = []
-        self.openai = OpenAI(api_key=Config.OPENAI_API_KEY) if Config.OPENAI_API_KEY else None
-        self._ready = False
+        # Live index + docs - replaced as a whole, never torn down in place
+        self._snapshot: Optional[IndexSnapshot] = None
+        self.openai: Optional[AsyncOpenAI] = None
+        self._batcher: Optional[EmbeddingBatcher] = None
+        # Published indexes are never mutated (see _writable) - searches need no lock against updates
+        self._search_batcher = SearchBatcher()
+        # Serializes builds and upsert / delete / sync
+        self._update_lock = asyncio.Lock()
+        # Same across workers: flock on FAISS_INDEX_PATH.lock (fd while held) + docs file we last saw
+        self._lock_fd: Optional[int] = None
+        self._disk_stamp: Optional[tuple] = None
+        # Rebuild queue: one running build + the newest pending Q&A list
+        self._build_task: Optional[asyncio.Task] = None
+        self._pending_build: Optional[list[dict]] = None
+        self._build_status = {
+            "state": "idle",
+            "pending": False,
+            "items": 0,
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "completed": 0,
+            # Last embedding run: total / reused / done (new) / batches / retries
+            "embedding": None,
+        }
         self._embedding_cache = None
-        self._embedding_dim = Config.EMBEDDING_DIM
     
     @classmethod
     def get_instance(cls):
@@ -129,125 +357,684 @@ class FAISSIndex:
             cls._instance = cls()
         return cls._instance
     
+    @property
+    def index(self) -> Optional[faiss.Index]:
+        snapshot = self._snapshot
+        return snapshot.index if snapshot else None
+    
+    @property
+    def docs(self) -> list[dict]:
+        snapshot = self._snapshot
+        return snapshot.docs if snapshot else []
+    
+    def snapshot(self) -> Optional[IndexSnapshot]:
+        """Current index + docs - hold on to it for the whole query"""
+        return self._snapshot
+    
+    def set_openai(self, openai_client: Optional[AsyncOpenAI]):
+        """Set shared async OpenAI client (owned by lifecycle)"""
+        self.openai = openai_client
+        self._batcher = EmbeddingBatcher(openai_client) if openai_client else None
+    
     def set_redis(self, redis_client):
-        """Set Redis client for embedding cache"""
+        """Set Redis client for embedding cache - must be binary-safe (decode_responses=False)"""
         if self.openai:
-            self._embedding_cache = EmbeddingCache(redis_client, self.openai)
+            self._embedding_cache = EmbeddingCache(redis_client, self.openai, self._batcher)
     
     def is_ready(self) -> bool:
-        return self._ready and self.index is not None
-    
-    def _cleanup(self):
-        """Free memory before rebuild"""
-        if self.index is not None:
-            del self.index
-            self.index = None
-        if self.docs:
-            del self.docs
-            self.docs = []
-        self._ready = False
-        gc.collect()
-    
-    def build(self, qa_list: list[dict]):
-        """Build FAISS index from Q&A list (sync)"""
+        return self._snapshot is not None
+    
+    def is_outdated(self) -> bool:
+        """Live index predates per-variant rows - a KB diff never touches every doc, so rebuild it once"""
+        snapshot = self._snapshot
+        return snapshot is not None and "artifact" not in snapshot.info and snapshot.variant_bits != VARIANT_BITS
+    
+    # =========================================================================
+    # Full builds - double-buffered: the live index serves until the new one is swapped in
+    # =========================================================================
+    
+    def request_rebuild(self, qa_list: list[dict]) -> dict:
+        """
+        Queue a background rebuild and return the build status.
+        Requests arriving while a build runs collapse into one follow-up
+        build with the newest Q&A list.
+        """
+        self._pending_build = qa_list
+        if self._build_task is None or self._build_task.done():
+            self._build_status["state"] = "queued"
+            self._build_task = asyncio.create_task(self._run_builds())
+        else:
+            self._build_status["pending"] = True
+        return self.get_build_status()
+    
+    def is_building(self) -> bool:
+        """A background rebuild is queued or running"""
+        return self._build_task is not None and not self._build_task.done()
+    
+    async def _run_builds(self):
+        while self._pending_build is not None:
+            qa_list, self._pending_build = self._pending_build, None
+            self._build_status["pending"] = False
+            await self.build_async(qa_list)
+    
+    def get_build_status(self) -> dict:
+        status = dict(self._build_status)
+        if status.get("embedding"):
+            status["embedding"] = dict(status["embedding"])
+        return status
+    
+    def get_index_info(self) -> dict:
+        """Live index type + build-time recall"""
+        snapshot = self._snapshot
+        return dict(snapshot.info) if snapshot else {}
+    
+    async def build_async(self, qa_list: list[dict]) -> bool:
+        """
+        Build a new FAISS index from a Q&A list and swap it in.
+        Embeddings go through the async client; index construction runs in a thread.
+        On failure the current index stays live.
+        """
         if not self.openai:
             print("[WARN] FAISS disabled: no OpenAI API key")
-            return
+            return False
         
         if not qa_list:
             print("[WARN] FAISS: no Q&A items to index")
-            return
+            return False
+        
+        # One build at a time (in any worker); no upsert / delete against an index about to be replaced
+        async with self._update_lock, self._disk_writer(refresh=False):
+            self._build_status.update(
+                state="building", items=len(qa_list), started_at=time.time(), finished_at=None, error=None,
+                embedding=None,
+            )
+            try:
+                snapshot = await self.build_snapshot(qa_list)
+                
+                # Publish - queries move to the new index on their next lookup
+                await self._persist(snapshot)
+            
+            except Exception as e:
+                print(f"[ERROR] FAISS build failed, keeping current index: {e}")
+                self._build_status.update(state="failed", finished_at=time.time(), error=str(e))
+                return False
+            
+            self._build_status.update(
+                state="idle", finished_at=time.time(), completed=self._build_status["completed"] + 1
+            )
+            return True
+    
+    async def build_snapshot(self, qa_list: list[dict]) -> IndexSnapshot:
+        """Embed (reusing the embedding store) and build an index without publishing it"""
+        docs = assign_doc_ids(list(qa_list))
+        
+        # Use only questions for FAISS semantic search - one row per language variant
+        labels, texts = self._rows(docs)
+        
+        print(f"[INFO] Building FAISS index for {len(docs)} items ({len(texts)} question variants)...")
+        
+        vectors, detected_dim = await self._embed_with_store(texts)
+        
+        return await asyncio.to_thread(self._build_snapshot, docs, vectors, labels, detected_dim)
+    
+    async def _embed_with_store(self, texts: list[str], compact: bool = True) -> tuple[np.ndarray, int]:
+        """
+        Embed only texts the on-disk store hasn't seen (new / edited FAQs),
+        reuse stored vectors for the rest.
+        compact: `texts` is the whole KB (full build) - stale rows may be dropped.
+        """
+        if not texts:
+            dim = self._snapshot.dim if self._snapshot else Config.EMBEDDING_DIM
+            return np.zeros((0, dim), dtype="float32"), dim
+        
+        store = EmbeddingStore(Config.EMBEDDING_STORE_DIR, Config.EMBEDDING_MODEL)
+        await asyncio.to_thread(store.load)
+        
+        vectors, missing = store.lookup(texts)
+        progress = {"total": len(texts), "reused": len(texts) - len(missing), "done": 0, "batches": 0, "retries": 0}
+        self._build_status["embedding"] = progress
+        if missing:
+            new_vectors, detected_dim = await self._embed_checkpointed(store, [texts[i] for i in missing], progress)
+            
+            if vectors is not None and vectors.shape[1] != detected_dim:
+                # Stored rows have another dimension - nothing reusable
+                missing_set = set(missing)
+                found = [i for i in range(len(texts)) if i not in missing_set]
+                vectors = np.zeros((len(texts), detected_dim), dtype="float32")
+                if found:
+                    vectors[found], _ = await self._embed_checkpointed(store, [texts[i] for i in found], progress)
+                progress["reused"] = 0
+            if vectors is None:
+                vectors = np.zeros((len(texts), detected_dim), dtype="float32")
+            vectors[missing] = new_vectors
+        
+        print(f"[INFO] Embeddings: {progress['reused']} reused, {len(texts) - progress['reused']} new")
+        
+        # Compact once dead rows (deleted / edited FAQs) outnumber live ones
+        try:
+            if compact and store.garbage(texts) > len(texts):
+                removed = await asyncio.to_thread(store.compact, texts)
+                print(f"[INFO] Embedding store compacted: {removed} stale rows removed")
+        except Exception as e:
+            print(f"[WARN] Embedding store compaction failed: {e}")
+        
+        return vectors, vectors.shape[1]
+    
+    async def _embed_checkpointed(self, store: EmbeddingStore, texts: list[str], progress: dict) -> tuple[np.ndarray, int]:
+        """
+        embed_batch, appending finished batches to the embedding store every
+        EMBEDDING_CHECKPOINT_ROWS - an interrupted build resumes from there.
+        """
+        pending_texts: list[str] = []
+        pending_vectors: list[np.ndarray] = []
+        flush_lock = asyncio.Lock()
+        
+        async def flush():
+            async with flush_lock:
+                if not pending_texts:
+                    return
+                batch_texts, batch_vectors = list(pending_texts), np.concatenate(pending_vectors)
+                pending_texts.clear()
+                pending_vectors.clear()
+                try:
+                    await asyncio.to_thread(store.add, batch_texts, batch_vectors)
+                except Exception as e:
+                    print(f"[WARN] Failed to persist embeddings: {e}")
+        
+        async def on_batch(positions: list[int], batch_vectors: np.ndarray):
+            pending_texts.extend(texts[i] for i in positions)
+            pending_vectors.append(batch_vectors)
+            if len(pending_texts) >= Config.EMBEDDING_CHECKPOINT_ROWS:
+                await flush()
+                print(f"[INFO] Embedding checkpoint: {progress['done']}/{len(texts)} new vectors saved")
         
+        cache = EmbeddingCache(None, self.openai)
         try:
-            self._cleanup()
-            self.docs = qa_list
+            return await cache.embed_batch(texts, on_batch, progress)
+        finally:
+            # Failed / cancelled builds keep every batch already paid for
+            await flush()
+    
+    def _build_snapshot(self, docs: list[dict], vectors: np.ndarray, labels: np.ndarray, detected_dim: int) -> IndexSnapshot:
+        """Normalize vectors and build the index (CPU-bound, sync)"""
+        faiss.normalize_L2(vectors)
+        
+        # Index type by corpus size + memory budget; labels are doc-id hashes + variant slot (upsert, delete)
+        kind = choose_index_type(len(vectors), detected_dim)
+        info = {"index_type": kind, "variant_bits": VARIANT_BITS}
+        try:
+            index = create_index(kind, vectors, labels)
+        except Exception as e:
+            print(f"[WARN] FAISS {kind} index build failed ({e}), using exact search")
+            index = create_index(FLAT, vectors, labels)
+            info.update(index_type=FLAT, fallback_from=kind)
+        
+        # Guardrail: approximate search must stay close to exact search
+        if info["index_type"] != FLAT:
+            recall = measure_recall(index, vectors, labels)
+            info.update(recall_k=Config.FAISS_RECALL_K, recall=round(recall, 4))
+            if recall < Config.FAISS_MIN_RECALL:
+                print(f"[WARN] FAISS {kind} recall@{Config.FAISS_RECALL_K}={recall:.3f} "
+                      f"< {Config.FAISS_MIN_RECALL}, using exact search")
+                index = create_index(FLAT, vectors, labels)
+                info.update(index_type=FLAT, fallback_from=kind)
+        
+        print(f"[INFO] FAISS index built: {index.ntotal} vectors, dim={detected_dim}, {info}")
+        return IndexSnapshot(index, docs, detected_dim, info)
+    
+    @staticmethod
+    def _labels(docs: list[dict]) -> np.ndarray:
+        """One label per doc (indexes from before per-variant rows)"""
+        return np.array([faiss_id(d["id"]) for d in docs], dtype="int64")
+    
+    @staticmethod
+    def _rows(docs: list[dict]) -> tuple[np.ndarray, list[str]]:
+        """(row labels, texts) - every question variant of every doc"""
+        labels, texts = [], []
+        for doc in docs:
+            base = faiss_id(doc["id"]) << VARIANT_BITS
+            for slot, text in embedding_texts(doc):
+                labels.append(base | slot)
+                texts.append(text)
+        return np.array(labels, dtype="int64"), texts
+    
+    @staticmethod
+    def _slot_labels(docs: list[dict]) -> np.ndarray:
+        """Every row label a doc may own (remove_ids ignores absent ones)"""
+        slots = np.arange(1 << VARIANT_BITS, dtype="int64")
+        bases = np.array([faiss_id(d["id"]) << VARIANT_BITS for d in docs], dtype="int64")
+        return (bases[:, None] | slots).ravel()
+    
+    # =========================================================================
+    # Incremental updates - cost scales with the change, not the KB
+    # =========================================================================
+    
+    async def upsert(self, items: list[dict]) -> dict:
+        """Add new Q&A items / replace edited ones (matched by id). Unchanged versions are skipped."""
+        if not self.is_ready():
+            raise RuntimeError("FAISS index not ready")
+        
+        async with self._update_lock, self._disk_writer():
+            snapshot = self._snapshot
+            items = assign_doc_ids([dict(item) for item in items])
+            current = {d["id"]: d for d in snapshot.docs}
+            changed = [it for it in items if current.get(it["id"], {}).get("version") != it["version"]]
+            if not changed:
+                return {"upserted": 0, "unchanged": len(items), "vectors": snapshot.index.ntotal}
             
-            # Use only questions for FAISS semantic search
-            # Keywords are for keyword search only (different purpose)
-            texts = []
-            for qa in qa_list:
-                q = qa.get("q", "")
-                q_en = qa.get("q_en", "")
-                q_ja = qa.get("q_ja", "")
-                # Only questions - no keywords (keywords pollute semantic meaning)
-                combined = f"{q} {q_en} {q_ja}".strip()
-                texts.append(combined)
+            # Replace edited docs in place, append new ones
+            by_id = {it["id"]: it for it in changed}
+            docs = [by_id.pop(d["id"], d) for d in snapshot.docs]
+            docs.extend(by_id.values())
             
-            print(f"[INFO] Building FAISS index for {len(texts)} items...")
+            if not self._patchable(snapshot):
+                snapshot = await self._rebuild_from(docs)
+            else:
+                labels, texts = self._rows(changed)
+                vectors, dim = await self._embed_with_store(texts, compact=False)
+                if dim != snapshot.dim:
+                    raise ValueError(f"Embedding dim {dim} != index dim {snapshot.dim} - full rebuild required")
+                faiss.normalize_L2(vectors)
+                # Old versions may have had more variants - drop every slot first
+                stale = self._slot_labels(changed)
+                index = await self._writable(snapshot)
+                
+                def apply():
+                    index.remove_ids(stale)
+                    index.add_with_ids(vectors, labels)
+                
+                await asyncio.to_thread(apply)
+                snapshot = await self._persist(IndexSnapshot(index, docs, snapshot.dim, snapshot.info))
             
-            cache = EmbeddingCache(None, self.openai)
-            vectors, detected_dim = cache.embed_sync(texts)
+            print(f"[INFO] FAISS upsert: {len(changed)} changed, {len(items) - len(changed)} unchanged")
+            return {"upserted": len(changed), "unchanged": len(items) - len(changed), "vectors": snapshot.index.ntotal}
+    
+    async def delete(self, ids: list[str]) -> dict:
+        """Remove docs by id - "deleted" counts docs, whatever number of vector rows they had"""
+        if not self.is_ready():
+            raise RuntimeError("FAISS index not ready")
+        
+        async with self._update_lock, self._disk_writer():
+            snapshot = self._snapshot
+            ids = {str(i) for i in ids}
+            existing = [d for d in snapshot.docs if d["id"] in ids]
+            if not existing:
+                return {"deleted": 0, "vectors": snapshot.index.ntotal}
+            docs = [d for d in snapshot.docs if d["id"] not in ids]
             
-            faiss.normalize_L2(vectors)
+            if not self._patchable(snapshot):
+                snapshot = await self._rebuild_from(docs)
+            else:
+                labels = self._slot_labels(existing)
+                index = await self._writable(snapshot)
+                
+                await asyncio.to_thread(index.remove_ids, labels)
+                snapshot = await self._persist(IndexSnapshot(index, docs, snapshot.dim, snapshot.info))
             
-            self._embedding_dim = detected_dim
-            self.index = faiss.IndexFlatIP(detected_dim)
-            self.index.add(vectors)
+            print(f"[INFO] FAISS delete: {len(existing)} docs removed")
+            return {"deleted": len(existing), "vectors": snapshot.index.ntotal}
+    
+    async def sync(self, qa_list: list[dict]) -> dict:
+        """Apply a KB diff: upsert new / edited items, delete removed ones"""
+        live_ids = {d["id"] for d in assign_doc_ids(list(qa_list))}
+        removed = [d["id"] for d in self.docs if d["id"] not in live_ids]
+        result = {"deleted": 0}
+        if removed:
+            result.update(await self.delete(removed))
+        result.update(await self.upsert(qa_list))
+        return result
+    
+    async def _rebuild_from(self, docs: list[dict]) -> IndexSnapshot:
+        """
+        Full index over `docs` for indexes that can't be patched (see _patchable).
+        Vectors come from the embedding store - only new texts hit the API.
+        """
+        if not docs:
+            dim = self._snapshot.dim
+            info = {"index_type": FLAT, "variant_bits": VARIANT_BITS}
+            return await self._persist(IndexSnapshot(faiss.IndexIDMap2(faiss.IndexFlatIP(dim)), [], dim, info))
+        labels, texts = self._rows(docs)
+        vectors, dim = await self._embed_with_store(texts, compact=False)
+        snapshot = await asyncio.to_thread(self._build_snapshot, docs, vectors, labels, dim)
+        return await self._persist(snapshot)
+    
+    @staticmethod
+    def _patchable(snapshot: IndexSnapshot) -> bool:
+        """
+        Vectors can be removed in place - not for HNSW, nor for indexes from before
+        per-variant rows (the first edit rebuilds them in the new layout)
+        """
+        return snapshot.info["index_type"] in REMOVABLE and snapshot.variant_bits == VARIANT_BITS
+    
+    async def _writable(self, snapshot: IndexSnapshot):
+        """
+        Private copy of the live index to patch. Readers keep the published snapshot
+        (index + docs as one unit) until the patched copy is swapped in with its docs.
+        """
+        if isinstance(snapshot.index, MmapFlatIndex):
+            return await asyncio.to_thread(snapshot.index.to_faiss)
+        if snapshot.read_only:
+            # Mapped read-only - reload from the saved file
+            index = await asyncio.to_thread(faiss.read_index, Config.FAISS_INDEX_PATH)
+        else:
+            # Serialize + deserialize copies any index type (IDMap2 + IVF / SQ8 included)
+            index = await asyncio.to_thread(lambda: faiss.deserialize_index(faiss.serialize_index(snapshot.index)))
+        tune(index, snapshot.info["index_type"])
+        return index
+    
+    # =========================================================================
+    # Cross-worker writes - every worker reloads / syncs the same KB into the same files
+    # =========================================================================
+    
+    @asynccontextmanager
+    async def _disk_writer(self, refresh: bool = True):
+        """
+        Hold the index file lock for a whole change (embed + save).
+        refresh: first pick up an index another worker saved meanwhile - the
+        same KB change then diffs to nothing instead of being re-embedded and rewritten.
+        """
+        await asyncio.to_thread(self._acquire_file_lock)
+        try:
+            if refresh:
+                await asyncio.to_thread(self._refresh_from_disk)
+            yield
+        finally:
+            self._release_file_lock()
+    
+    @contextmanager
+    def _file_lock(self):
+        """Sync form of _disk_writer (no refresh) - a no-op inside a held lock"""
+        if self._lock_fd is not None:
+            yield
+            return
+        self._acquire_file_lock()
+        try:
+            yield
+        finally:
+            self._release_file_lock()
+    
+    def _acquire_file_lock(self):
+        """
+        flock blocks until the worker holding it is done (released on close / exit).
+        Writers inside one worker are already serialized by _update_lock.
+        """
+        os.makedirs(os.path.dirname(Config.FAISS_INDEX_PATH) or ".", exist_ok=True)
+        fd = os.open(f"{Config.FAISS_INDEX_PATH}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._lock_fd = fd
+    
+    def _release_file_lock(self):
+        fd, self._lock_fd = self._lock_fd, None
+        if fd is not None:
+            os.close(fd)
+    
+    @staticmethod
+    def _stat_docs() -> Optional[tuple]:
+        try:
+            st = os.stat(Config.FAISS_INDEX_PATH.replace(".index", ".docs.json"))
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+    
+    @staticmethod
+    def _stat_file(path: str) -> Optional[list]:
+        """Identity of a renamed-into-place file (a new rename = a new inode) - serving files are local only"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return [st.st_ino, st.st_mtime_ns, st.st_size]
+    
+    def _refresh_from_disk(self):
+        """Load the saved index if another worker replaced it since our last load / save"""
+        snapshot = self._snapshot
+        if snapshot is None or "artifact" in snapshot.info:
+            return
+        stamp = self._stat_docs()
+        if stamp is not None and stamp != self._disk_stamp:
+            print("[INFO] FAISS index changed on disk (another worker), reloading")
+            self.load()
+    
+    async def _persist(self, snapshot: IndexSnapshot) -> IndexSnapshot:
+        """
+        Save, then publish - re-mapped from the serving files in MMAP_SERVING mode.
+        A failed save publishes nothing (the files on disk are not this snapshot)
+        and raises RuntimeError - the current index keeps serving.
+        """
+        try:
+            await asyncio.to_thread(self._save, snapshot)
+        except Exception as e:
+            print(f"[ERROR] Failed to save FAISS index, keeping current index: {e}")
+            raise RuntimeError(f"Failed to save FAISS index: {e}") from e
+        if Config.MMAP_SERVING:
+            snapshot = await asyncio.to_thread(self._open_serving) or snapshot
+        self._snapshot = snapshot
+        return snapshot
+    
+    @staticmethod
+    def _serving_paths() -> tuple[str, str, str]:
+        """(vectors .npy, labels .npy, columnar docs) next to FAISS_INDEX_PATH"""
+        base = Config.FAISS_INDEX_PATH.replace(".index", "")
+        return f"{base}.vectors.npy", f"{base}.labels.npy", f"{base}.docs.bin"
+    
+    def _save(self, snapshot: Optional[IndexSnapshot] = None):
+        """
+        Save FAISS index to disk with metadata (temp file + rename - readers never see a partial file).
+        docs.json goes last and carries the index file's sha1: a crash between the renames
+        leaves a pair load() rejects instead of new vectors under old docs. Raises on failure.
+        """
+        snapshot = snapshot or self._snapshot
+        index_path = Config.FAISS_INDEX_PATH
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        tmp = f"{index_path}.{os.getpid()}.tmp"
+        faiss.write_index(snapshot.index, tmp)
+        index_sha1 = file_sha1(tmp)
+        os.replace(tmp, index_path)
+        
+        docs_path = index_path.replace(".index", ".docs.json")
+        meta = {
+            "docs": list(snapshot.docs),
+            "embedding_dim": snapshot.dim,
+            "embedding_model": Config.EMBEDDING_MODEL,
+            "index": snapshot.info,
+            "index_sha1": index_sha1,
+            "version": 2
+        }
+        tmp = f"{docs_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, docs_path)
+        
+        if Config.MMAP_SERVING:
+            self._save_serving(snapshot, meta)
+        self._disk_stamp = self._stat_docs()
+        
+        print(f"[INFO] FAISS index saved: {index_path}")
+    
+    def _save_serving(self, snapshot: IndexSnapshot, meta: dict):
+        """
+        Columnar doc store + (flat only) raw vectors / labels as .npy - mapped, never parsed, by workers.
+        Other index types are mapped straight from the FAISS file (IO_FLAG_MMAP).
+        """
+        vectors_path, labels_path, docs_path = self._serving_paths()
+        if snapshot.info["index_type"] == FLAT:
+            index = snapshot.index
+            vectors = index.index.reconstruct_n(0, index.ntotal)
+            labels = faiss.vector_to_array(index.id_map).astype("int64")
+            
+            for path, array in ((vectors_path, vectors), (labels_path, labels)):
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    np.save(f, array)
+                os.replace(tmp, path)
+            mapped = (vectors_path, labels_path)
+        else:
+            mapped = (Config.FAISS_INDEX_PATH,)
+        # Docs last, stamped with the files they pair with - a reader never maps new docs over old vectors
+        meta = {k: v for k, v in meta.items() if k != "docs"}
+        meta["serving_files"] = [self._stat_file(path) for path in mapped]
+        DocStore.write(docs_path, snapshot.docs, meta)
+    
+    def _open_serving(self) -> Optional[IndexSnapshot]:
+        """Map the serving files; None if missing or older than the FAISS index"""
+        vectors_path, labels_path, docs_path = self._serving_paths()
+        try:
+            if not os.path.exists(docs_path):
+                return None
+            if os.path.getmtime(docs_path) < os.path.getmtime(Config.FAISS_INDEX_PATH):
+                return None
             
-            self._ready = True
-            print(f"[INFO] FAISS index built: {self.index.ntotal} vectors, dim={detected_dim}")
+            docs = DocStore(docs_path)
+            info = docs.meta.get("index", {"index_type": FLAT})
+            mapped = (vectors_path, labels_path) if info["index_type"] == FLAT else (Config.FAISS_INDEX_PATH,)
+            if docs.meta.get("serving_files") != [self._stat_file(path) for path in mapped]:
+                # Interrupted save (or files from another host) - rewritten from faiss.index by load()
+                print(f"[WARN] FAISS serving files don't match their docs: {docs_path}")
+                return None
+            dim = docs.meta.get("embedding_dim", Config.EMBEDDING_DIM)
+            saved_model = docs.meta.get("embedding_model", "")
+            if saved_model and saved_model != Config.EMBEDDING_MODEL:
+                print(f"[WARN] Embedding model changed: {saved_model} -> {Config.EMBEDDING_MODEL}")
             
-            self._save()
+            if info["index_type"] != FLAT:
+                # IVF lists are mapped; FAISS 1.7 still reads HNSW / SQ8 codes into memory
+                index = faiss.read_index(Config.FAISS_INDEX_PATH, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                tune(index, info["index_type"])
+                return IndexSnapshot(index, docs, dim, info, read_only=True)
             
+            if not os.path.exists(vectors_path) or not os.path.exists(labels_path):
+                return None
+            vectors = np.load(vectors_path, mmap_mode="r")
+            labels = np.load(labels_path)
+            if vectors.ndim != 2 or len(labels) != len(vectors):
+                print(f"[WARN] FAISS serving files inconsistent: {vectors_path}")
+                return None
+            return IndexSnapshot(MmapFlatIndex(vectors, labels), docs, dim, info)
         except Exception as e:
-            print(f"[ERROR] FAISS build failed: {e}")
-            self._ready = False
+            print(f"[WARN] Failed to map FAISS serving files: {e}")
+            return None
     
-    async def build_async(self, qa_list: list[dict]):
-        """Build FAISS index asynchronously"""
-        await asyncio.to_thread(self.build, qa_list)
+    @staticmethod
+    def artifact_files(snapshot: IndexSnapshot) -> dict:
+        """
+        Artifact writers for the FAISS half of a build (see services.artifacts).
+        Docs come from the KB half (docs.bin) - same rows, matched by id.
+        """
+        index = snapshot.index
+        files = {"faiss.index": lambda path: faiss.write_index(index, path)}
+        if snapshot.info["index_type"] == FLAT:
+            # Raw vectors + labels for MmapFlatIndex (MMAP_SERVING)
+            files["vectors.npy"] = lambda path: np.save(path, index.index.reconstruct_n(0, index.ntotal))
+            files["labels.npy"] = lambda path: np.save(path, faiss.vector_to_array(index.id_map).astype("int64"))
+        return files
     
-    def _save(self):
-        """Save FAISS index to disk with metadata"""
+    def load_artifact(self, path: str) -> bool:
+        """
+        Swap in the index of a published artifact (checksums are verified by the KB load).
+        Artifacts are immutable - the index is mapped read-only where FAISS allows.
+        """
         try:
-            index_path = Config.FAISS_INDEX_PATH
-            os.makedirs(os.path.dirname(index_path), exist_ok=True)
-            faiss.write_index(self.index, index_path)
+            manifest = artifacts.read_manifest(path)
+            info = manifest.get("index")
+            if not info:
+                print(f"[WARN] Artifact {manifest['version']} has no FAISS index")
+                return False
+            if manifest.get("embedding_model") != Config.EMBEDDING_MODEL:
+                print(f"[WARN] Embedding model changed: {manifest.get('embedding_model')} -> {Config.EMBEDDING_MODEL}")
             
-            docs_path = index_path.replace(".index", ".docs.json")
-            meta = {
-                "docs": self.docs,
-                "embedding_dim": self._embedding_dim,
-                "embedding_model": Config.EMBEDDING_MODEL,
-                "version": 2
-            }
-            with open(docs_path, "w", encoding="utf-8") as f:
-                json.dump(meta, f, ensure_ascii=False)
+            docs = DocStore(os.path.join(path, "docs.bin"))
+            if info["index_type"] == FLAT and Config.MMAP_SERVING:
+                vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+                index = MmapFlatIndex(vectors, np.load(os.path.join(path, "labels.npy")))
+            else:
+                flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if Config.MMAP_SERVING else 0
+                index = faiss.read_index(os.path.join(path, "faiss.index"), flags)
+                tune(index, info["index_type"])
             
-            print(f"[INFO] FAISS index saved: {index_path}")
+            self._snapshot = IndexSnapshot(
+                index, docs, manifest["embedding_dim"], {**info, "artifact": manifest["version"]}, read_only=True
+            )
+            print(f"[INFO] FAISS artifact {manifest['version']} loaded: {index.ntotal} vectors, {info}")
+            return True
         except Exception as e:
-            print(f"[WARN] Failed to save FAISS index: {e}")
+            print(f"[ERROR] Failed to load FAISS artifact {path}: {e} (keeping current index)")
+            return False
     
     def load(self) -> bool:
-        """Load FAISS index from disk"""
+        """Load FAISS index from disk and swap it in"""
         try:
-            self._cleanup()
-            
             index_path = Config.FAISS_INDEX_PATH
             docs_path = index_path.replace(".index", ".docs.json")
             
             if not os.path.exists(index_path) or not os.path.exists(docs_path):
                 return False
+            # Taken before reading - a save racing this load shows up as a change
+            stamp = self._stat_docs()
             
-            self.index = faiss.read_index(index_path)
+            # Serving mode - map vectors + docs, no index read or JSON parse
+            if Config.MMAP_SERVING:
+                snapshot = self._open_serving()
+                if snapshot is not None:
+                    self._snapshot = snapshot
+                    self._disk_stamp = stamp
+                    print(f"[INFO] FAISS index mapped: {snapshot.index.ntotal} vectors, dim={snapshot.dim}")
+                    return True
             
             with open(docs_path, "r", encoding="utf-8") as f:
                 data = json.load(f)
             
+            expected = data.get("index_sha1") if isinstance(data, dict) else None
+            if expected and file_sha1(index_path) != expected:
+                # Crash between the two renames in _save - the pair is from different saves
+                print(f"[WARN] FAISS index does not match {docs_path} (interrupted save), ignoring both")
+                return False
+            index = faiss.read_index(index_path)
+            
             # Handle both old and new format
+            info = None
             if isinstance(data, list):
-                self.docs = data
-                self._embedding_dim = Config.EMBEDDING_DIM
+                docs = data
+                dim = Config.EMBEDDING_DIM
             else:
-                self.docs = data.get("docs", [])
-                self._embedding_dim = data.get("embedding_dim", Config.EMBEDDING_DIM)
+                docs = data.get("docs", [])
+                dim = data.get("embedding_dim", Config.EMBEDDING_DIM)
+                info = data.get("index")
                 saved_model = data.get("embedding_model", "")
                 
                 if saved_model and saved_model != Config.EMBEDDING_MODEL:
                     print(f"[WARN] Embedding model changed: {saved_model} -> {Config.EMBEDDING_MODEL}")
             
-            self._ready = True
-            print(f"[INFO] FAISS index loaded: {self.index.ntotal} vectors, dim={self._embedding_dim}")
+            # Older doc stores have no ids - derive them the same way as the KB
+            assign_doc_ids(docs)
+            
+            # Older indexes are positional (IndexFlatIP) - wrap in an ID map once
+            migrated = isinstance(index, faiss.IndexFlat)
+            if migrated:
+                vectors = index.reconstruct_n(0, index.ntotal)
+                index = faiss.IndexIDMap2(faiss.IndexFlatIP(index.d))
+                index.add_with_ids(vectors, self._labels(docs))
+            
+            snapshot = IndexSnapshot(index, docs, dim, info)
+            tune(index, snapshot.info["index_type"])
+            self._disk_stamp = stamp
+            if migrated or Config.MMAP_SERVING:
+                # Rewrite once - migrated layout and / or the serving files other workers map
+                try:
+                    with self._file_lock():
+                        self._save(snapshot)
+                except Exception as e:
+                    print(f"[WARN] Failed to save FAISS index: {e}")
+            if migrated:
+                print("[INFO] FAISS index migrated to ID-mapped layout")
+            if Config.MMAP_SERVING:
+                snapshot = self._open_serving() or snapshot
+            self._snapshot = snapshot
+            
+            print(f"[INFO] FAISS index loaded: {index.ntotal} vectors, dim={dim}")
             return True
         except Exception as e:
             print(f"[WARN] Failed to load FAISS index: {e}")
@@ -258,37 +1045,77 @@ class FAISSIndex:
         Search using FAISS with cached embeddings.
         Returns empty list if Redis unavailable (fail closed - fallback to keyword search).
         """
-        if not self.is_ready():
+        vec = await self.embed_query(query)
+        if vec is None:
             return []
+        return await self.search_vector(vec, top_k)
+    
+    async def embed_query(self, query: str) -> Optional[np.ndarray]:
+        """
+        Get L2-normalized (1, dim) query vector via the embedding cache.
+        Returns None if not ready or Redis unavailable (fail closed).
+        """
+        if not self.is_ready():
+            return None
         
         if not self._embedding_cache:
             print("[WARN] Embedding cache not set")
-            return []
+            return None
         
         try:
             vec = await self._embedding_cache.get_or_embed(query)
-            
-            # Redis unavailable → fail closed → fallback to keyword search
-            if vec is None:
-                print("[INFO] FAISS search skipped (Redis unavailable)")
-                return []
-            
-            vec = vec.reshape(1, -1)
-            faiss.normalize_L2(vec)
-            
-            scores, indices = self.index.search(vec, top_k)
+        except Exception as e:
+            print(f"[ERROR] Query embedding failed: {e}")
+            return None
+        
+        # Redis unavailable → fail closed → fallback to keyword search
+        if vec is None:
+            print("[INFO] FAISS search skipped (Redis unavailable)")
+            return None
+        
+        vec = vec.reshape(1, -1)
+        faiss.normalize_L2(vec)
+        return vec
+    
+    async def search_vector(
+        self, vec: np.ndarray, top_k: int = 5, snapshot: Optional[IndexSnapshot] = None
+    ) -> list[dict]:
+        """
+        Search with a normalized (1, dim) query vector (against `snapshot` if given).
+        A doc scores its best-matching question variant (max-pool over its rows).
+        """
+        # Same index + docs for the whole query
+        snapshot = snapshot or self._snapshot
+        if snapshot is None:
+            return []
+        
+        try:
+            # Enough rows for top_k distinct docs even if each matches with every variant
+            rows = top_k << snapshot.variant_bits
+            # Stacked with concurrent queries, scanned in a worker thread
+            scores, labels = await self._search_batcher.search(snapshot.index, vec, rows)
             
             results = []
-            for rank, (score, i) in enumerate(zip(scores[0], indices[0])):
-                if i >= 0 and i < len(self.docs):
-                    doc = self.docs[i]
-                    results.append({
-                        "q": doc.get("q", ""),
-                        "a": doc.get("a", ""),
-                        "score": float(max(0.0, min(1.0, score))),
-                        "rank": rank + 1,
-                        "source": "faiss"
-                    })
+            seen = set()
+            for score, label in zip(scores[0], labels[0]):
+                doc = snapshot.doc(int(label)) if label >= 0 else None
+                # Rows come best-first - the first row of a doc is its max
+                if doc is None or doc["id"] in seen:
+                    continue
+                seen.add(doc["id"])
+                results.append({
+                    "id": doc["id"],
+                    "version": doc["version"],
+                    "q": doc.get("q", ""),
+                    "a": doc.get("a", ""),
+                    "score": float(max(0.0, min(1.0, score))),
+                    "rank": len(results) + 1,
+                    "source": "faiss"
+                })
+                if snapshot.variant_bits:
+                    results[-1]["variant"] = variant_name(int(label) & ((1 << snapshot.variant_bits) - 1))
+                if len(results) == top_k:
+                    break
             
             return results
         except Exception as e:
@@ -305,79 +1132,122 @@ class HybridSearch:
         self.kb = kb
         self.faiss_index = faiss_index
     
-    async def search(self, query: str, top_k: int = 3) -> list[dict]:
-        """Hybrid search with RRF score fusion"""
-        results_map = {}
-        
-        # FAISS search
-        if Config.USE_FAISS and self.faiss_index.is_ready():
+    async def search(
+        self,
+        query: str,
+        top_k: int = 3,
+        keyword_results: Optional[list[dict]] = None,
+        faiss_results: Optional[list[dict]] = None,
+        lexical_results: Optional[list[dict]] = None,
+    ) -> list[dict]:
+        """Hybrid search with RRF score fusion (FAISS + keyword + BM25 lexical)"""
+        # Reuse caller's results if already computed
+        if faiss_results is None and Config.USE_FAISS and self.faiss_index.is_ready():
             faiss_results = await self.faiss_index.search(query, top_k=top_k * 2)
-            for r in faiss_results:
-                key = r["q"]
-                rrf_faiss = 1.0 / (self.RRF_K + r["rank"])
-                
+        if keyword_results is None:
+            keyword_results = self.kb.search(query)
+        if lexical_results is None:
+            lexical_results = self.kb.lexical_search(query, top_k=top_k * 2)
+        
+        results_map = {}
+        for source, source_results in (
+            ("faiss", faiss_results or []),
+            ("keyword", keyword_results),
+            ("lexical", lexical_results),
+        ):
+            for rank, r in enumerate(source_results):
+                key = r["id"]
                 if key not in results_map:
                     results_map[key] = {
+                        "id": r["id"],
+                        "version": r["version"],
                         "q": r["q"],
                         "a": r["a"],
-                        "rrf_faiss": rrf_faiss,
-                        "rrf_keyword": 0,
-                        "raw_faiss": r["score"],
-                        "raw_keyword": 0
+                        "rrf_faiss": 0, "rrf_keyword": 0, "rrf_lexical": 0,
+                        "raw_faiss": 0, "raw_keyword": 0, "raw_lexical": 0,
                     }
-                else:
-                    results_map[key]["rrf_faiss"] = rrf_faiss
-                    results_map[key]["raw_faiss"] = r["score"]
-        
-        # Keyword search
-        keyword_results = self.kb.search(query)
-        for rank, r in enumerate(keyword_results):
-            key = r["q"]
-            rrf_keyword = 1.0 / (self.RRF_K + rank + 1)
-            
-            if key not in results_map:
-                results_map[key] = {
-                    "q": r["q"],
-                    "a": r["a"],
-                    "rrf_faiss": 0,
-                    "rrf_keyword": rrf_keyword,
-                    "raw_faiss": 0,
-                    "raw_keyword": r["score"]
-                }
-            else:
-                results_map[key]["rrf_keyword"] = rrf_keyword
-                results_map[key]["raw_keyword"] = r["score"]
+                results_map[key][f"rrf_{source}"] = 1.0 / (self.RRF_K + r.get("rank", rank + 1))
+                results_map[key][f"raw_{source}"] = r["score"]
         
         # Combine scores
         combined = []
         for key, data in results_map.items():
             final_score = (
                 Config.FAISS_WEIGHT * data["rrf_faiss"] +
-                Config.KEYWORD_WEIGHT * data["rrf_keyword"]
+                Config.KEYWORD_WEIGHT * data["rrf_keyword"] +
+                Config.LEXICAL_WEIGHT * data["rrf_lexical"]
             )
             # RRF score is already 0-0.016 range, multiply by factor to get 0-1
             # But also incorporate raw scores for better relevance signal
-            raw_score = max(data["raw_faiss"], data["raw_keyword"])
+            raw_score = max(data["raw_faiss"], data["raw_keyword"], data["raw_lexical"])
             # Final score: weighted average of RRF ranking + raw similarity
             normalized_score = (final_score * 30) * 0.5 + raw_score * 0.5
             normalized_score = min(1.0, normalized_score)
             
             combined.append({
+                "id": data["id"],
+                "version": data["version"],
                 "q": data["q"],
                 "a": data["a"],
                 "score": round(normalized_score, 3),
                 "faiss_score": round(data["raw_faiss"], 3),
                 "keyword_score": round(data["raw_keyword"], 3),
+                "lexical_score": round(data["raw_lexical"], 3),
                 "exact": data["raw_keyword"] >= 0.85
             })
         
         combined.sort(key=lambda x: x["score"], reverse=True)
         return combined[:top_k]
     
+    async def retrieve(self, query: str) -> RetrievalResult:
+        """
+        Run hybrid search once per request.
+        Direct answer, LLM context and its fallback all come from this single pass.
+        """
+        top_k = max(1, Config.MAX_SEARCH_RESULTS)
+        
+        # In-memory lexical layers first - no network I/O
+        keyword_results = self.kb.search(query)
+        lexical_results = self.kb.lexical_search(query, top_k=top_k * 2)
+        lexical_direct = self.kb.lexical_direct_answer(lexical_results)
+        exact = bool(keyword_results) and keyword_results[0]["exact"]
+        
+        # Embed once - the vector is kept for the semantic answer cache.
+        # Skipped when the lexical layers already have a confident answer.
+        query_vector = None
+        faiss_results = []
+        # One index snapshot per request - a rebuild swapping in mid-request doesn't mix indexes
+        snapshot = self.faiss_index.snapshot()
+        if not (exact or lexical_direct) and Config.USE_FAISS and snapshot is not None:
+            query_vector = await self.faiss_index.embed_query(query)
+            if query_vector is not None:
+                faiss_results = await self.faiss_index.search_vector(query_vector, top_k=top_k * 2, snapshot=snapshot)
+        
+        results = await self.search(
+            query,
+            top_k=top_k,
+            keyword_results=keyword_results,
+            faiss_results=faiss_results,
+            lexical_results=lexical_results
+        )
+        direct = self._direct_answer(results) or lexical_direct
+        context_docs = self._context_docs(results) if not direct else []
+        context = self._build_context(context_docs)
+        return RetrievalResult(results, keyword_results, direct, context, query_vector, context_docs)
+    
     async def get_direct_answer(self, query: str) -> Optional[dict]:
         """Get direct answer using hybrid search (high confidence only)"""
-        results = await self.search(query, top_k=1)
-        
+        return self._direct_answer(await self.search(query, top_k=1))
+    
+    async def get_context_for_llm(self, query: str) -> Optional[str]:
+        """
+        Get context for LLM summarization.
+        Uses SIMILARITY_THRESHOLD from config - no hardcoded lower bound.
+        """
+        results = await self.search(query, top_k=Config.MAX_SEARCH_RESULTS)
+        return self._build_context(self._context_docs(results))
+    
+    def _direct_answer(self, results: list[dict]) -> Optional[dict]:
         if not results:
             return None
         
@@ -394,20 +1264,12 @@ class HybridSearch:
         
         return None
     
-    async def get_context_for_llm(self, query: str) -> Optional[str]:
-        """
-        Get context for LLM summarization.
-        Uses SIMILARITY_THRESHOLD from config - no hardcoded lower bound.
-        """
-        results = await self.search(query, top_k=Config.MAX_SEARCH_RESULTS)
-        
-        if not results:
-            return None
-        
+    def _context_docs(self, results: list[dict]) -> list[dict]:
         # Use config threshold, minimum 0.4 to avoid garbage context
         context_threshold = max(0.4, Config.SIMILARITY_THRESHOLD)
-        relevant = [r for r in results if r["score"] >= context_threshold]
-        
+        return [r for r in results if r["score"] >= context_threshold]
+    
+    def _build_context(self, relevant: list[dict]) -> Optional[str]:
         if not relevant:
             return None
         
@@ -0,0 +1,128 @@
+"""
+Index Factory - pick and build a FAISS index type for the corpus size
+"""
+
+import math
+
+import numpy as np
+import faiss
+
+from config import Config
+
+
+FLAT = "flat"
+HNSW = "hnsw"
+SQ8 = "sq8"
+IVFPQ = "ivfpq"
+
+INDEX_TYPES = (FLAT, HNSW, SQ8, IVFPQ)
+
+# HNSW graphs can't drop vectors - upsert / delete rebuild the graph instead
+REMOVABLE = {FLAT, SQ8, IVFPQ}
+
+
+def estimate_bytes(kind: str, n: int, dim: int) -> int:
+    """Rough resident size of an index holding n vectors"""
+    if kind == FLAT:
+        per_vector = 4 * dim
+    elif kind == HNSW:
+        # Raw vectors + level-0 links (2M int32) + upper levels / bookkeeping
+        per_vector = 4 * dim + 8 * Config.FAISS_HNSW_M + 16
+    elif kind == SQ8:
+        per_vector = dim
+    else:
+        per_vector = _pq_m(dim) + 8
+    return n * (per_vector + 16)  # + id map
+
+
+def choose_index_type(n: int, dim: int) -> str:
+    """
+    FAISS_INDEX_TYPE, or for "auto":
+    flat (exact) while small and within budget → hnsw (graph, sub-linear)
+    → sq8 (8-bit scan, 4x smaller) → ivfpq (clustered + product-quantized)
+    """
+    kind = Config.FAISS_INDEX_TYPE
+    if kind in INDEX_TYPES:
+        return kind
+    
+    budget = Config.FAISS_MEMORY_BUDGET_MB * 1024 * 1024
+    if n <= Config.FAISS_FLAT_MAX_VECTORS and estimate_bytes(FLAT, n, dim) <= budget:
+        return FLAT
+    for kind in (HNSW, SQ8):
+        if estimate_bytes(kind, n, dim) <= budget:
+            return kind
+    return IVFPQ
+
+
+def create_index(kind: str, vectors: np.ndarray, labels: np.ndarray) -> faiss.Index:
+    """Build (train + add) an inner-product index of `kind` over normalized vectors"""
+    n, dim = vectors.shape
+    metric = faiss.METRIC_INNER_PRODUCT
+    
+    if kind == FLAT:
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    elif kind == HNSW:
+        graph = faiss.IndexHNSWFlat(dim, Config.FAISS_HNSW_M, metric)
+        graph.hnsw.efConstruction = Config.FAISS_HNSW_EF_CONSTRUCTION
+        index = faiss.IndexIDMap2(graph)
+    elif kind == SQ8:
+        index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, metric))
+    elif kind == IVFPQ:
+        # IVF stores ids itself (an IDMap on top would break remove_ids)
+        index = faiss.index_factory(dim, f"IVF{_nlist(n)},PQ{_pq_m(dim)}", metric)
+        # Polysemous codes are for Hamming pre-filtering (unused) and train very slowly
+        index.do_polysemous_training = False
+    else:
+        raise ValueError(f"Unknown FAISS index type: {kind}")
+    
+    if not index.is_trained:
+        sample = vectors
+        if n > Config.FAISS_TRAIN_SAMPLE:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(n, Config.FAISS_TRAIN_SAMPLE, replace=False)]
+        index.train(sample)
+    
+    index.add_with_ids(vectors, labels)
+    tune(index, kind)
+    return index
+
+
+def tune(index: faiss.Index, kind: str):
+    """Search-time knobs (not all survive write_index / read_index)"""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if kind == HNSW:
+        inner.hnsw.efSearch = max(Config.FAISS_HNSW_EF_SEARCH, Config.FAISS_RECALL_K)
+    elif kind == IVFPQ:
+        faiss.extract_index_ivf(inner).nprobe = Config.FAISS_IVF_NPROBE
+
+
+def measure_recall(index: faiss.Index, vectors: np.ndarray, labels: np.ndarray) -> float:
+    """
+    recall@k of `index` against exact search, using a sample of the indexed
+    vectors as queries (FAISS_RECALL_SAMPLE)
+    """
+    n = len(vectors)
+    k = min(Config.FAISS_RECALL_K, n)
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(n, min(Config.FAISS_RECALL_SAMPLE, n), replace=False)]
+    
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+    _, found = index.search(queries, k)
+    
+    hits = sum(len(set(labels[t]) & set(f)) for t, f in zip(truth, found))
+    return hits / (len(queries) * k)
+
+
+def _nlist(n: int) -> int:
+    # ~4·sqrt(n) clusters, each with enough points (~39) to train
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def _pq_m(dim: int) -> int:
+    """Sub-quantizers: largest divisor of dim ≤ FAISS_PQ_M (8 bits each)"""
+    m = min(Config.FAISS_PQ_M, dim)
+    while dim % m:
+        m -= 1
+    return m
@@ -0,0 +1,149 @@
+"""
+KB Watcher - reload knowledge.json in the background when it changes
+"""
+
+import os
+import sys
+import struct
+import ctypes
+import ctypes.util
+import asyncio
+from typing import Optional
+
+from config import Config
+from .knowledge import KnowledgeBase
+
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+
+_WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF
+)
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class _Inotify:
+    """Minimal inotify binding via libc (Linux only, no extra dependency)"""
+    
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed: {directory}")
+    
+    def read_events(self) -> list[tuple[int, str]]:
+        """Drain pending events - [(mask, file name)]"""
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset + _EVENT.size <= len(buf):
+                _, mask, _, length = _EVENT.unpack_from(buf, offset)
+                offset += _EVENT.size
+                name = buf[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+                offset += length
+                events.append((mask, name))
+    
+    def close(self):
+        os.close(self.fd)
+
+
+class KBWatcher:
+    """
+    Reloads the KB off the request path.
+    inotify on the KB directory (catches in-place writes and atomic renames),
+    stat() polling every KB_WATCH_INTERVAL seconds where inotify is unavailable
+    (non-Linux, or bind mounts that don't deliver events - set KB_WATCH=poll).
+    """
+    
+    def __init__(self, kb: KnowledgeBase, path: Optional[str] = None):
+        self.kb = kb
+        self.path = os.path.abspath(path or Config.KNOWLEDGE_FILE)
+        self.mode: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        if Config.KB_WATCH == "off":
+            print("[INFO] KB watcher disabled")
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        if Config.KB_WATCH != "poll" and sys.platform.startswith("linux"):
+            try:
+                await self._watch_inotify()
+                return
+            except OSError as e:
+                print(f"[WARN] inotify unavailable ({e}), polling KB every {Config.KB_WATCH_INTERVAL}s")
+        await self._watch_poll()
+    
+    async def _watch_inotify(self):
+        directory, filename = os.path.split(self.path)
+        inotify = _Inotify(directory)
+        changed = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        loop.add_reader(inotify.fd, changed.set)
+        self.mode = "inotify"
+        print(f"[INFO] KB watcher: inotify on {directory}")
+        
+        try:
+            while True:
+                await changed.wait()
+                # The reader is level-triggered - unregister while events pile up unread,
+                # or it fires on every loop iteration for the whole debounce
+                loop.remove_reader(inotify.fd)
+                # Editors write in several steps - let the burst settle
+                await asyncio.sleep(Config.KB_WATCH_DEBOUNCE_MS / 1000)
+                changed.clear()
+                
+                events = inotify.read_events()
+                loop.add_reader(inotify.fd, changed.set)
+                if any(mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED) for mask, _ in events):
+                    raise OSError(0, f"watched directory went away: {directory}")
+                if any(name == filename for _, name in events):
+                    await self._reload()
+        finally:
+            loop.remove_reader(inotify.fd)
+            inotify.close()
+    
+    async def _watch_poll(self):
+        self.mode = "poll"
+        while True:
+            await asyncio.sleep(Config.KB_WATCH_INTERVAL)
+            await self._reload()
+    
+    async def _reload(self):
+        """Re-index in a worker thread; load() publishes only if the file changed"""
+        try:
+            await asyncio.to_thread(self.kb.load)
+        except Exception as e:
+            print(f"[ERROR] KB reload failed: {e}")
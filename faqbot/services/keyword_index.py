@@ -0,0 +1,106 @@
+"""
+Keyword Index - Aho-Corasick automaton over KB keywords + exact question map
+"""
+
+from collections import deque
+
+
+class AhoCorasick:
+    """
+    Multi-pattern substring matcher.
+    Each pattern maps to a set of values; match() returns the union of values
+    of every pattern found in the text, in one pass over its characters.
+    """
+    
+    def __init__(self, patterns: dict[str, set[int]]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[frozenset[int]] = [frozenset()]
+        
+        for pattern, values in patterns.items():
+            self._insert(pattern, values)
+        self._build_failure_links()
+    
+    def _insert(self, pattern: str, values: set[int]):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(frozenset())
+            state = nxt
+        self._out[state] = self._out[state] | values
+    
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                # Inherit matches that end here via the failure link
+                self._out[nxt] = self._out[nxt] | self._out[self._fail[nxt]]
+    
+    def match(self, text: str) -> set[int]:
+        found = set()
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+    
+    def __len__(self) -> int:
+        return len(self._goto)
+
+
+class KeywordIndex:
+    """
+    Built once per KB load.
+    - automaton: qualifying keywords → item positions
+    - exact: normalized question → item positions
+    """
+    
+    MIN_KEYWORD_LENGTH = 5
+    MIN_UNIQUE_CHARS = 3
+    
+    def __init__(self, qa_list: list[dict]):
+        keywords: dict[str, set[int]] = {}
+        self.exact: dict[str, list[int]] = {}
+        
+        for pos, item in enumerate(qa_list):
+            for kw in item.get("keywords", []):
+                kw_lower = kw.lower()
+                if self.qualifies(kw_lower):
+                    keywords.setdefault(kw_lower, set()).add(pos)
+            
+            q_norm = item.get("q", "").lower().strip()
+            self.exact.setdefault(q_norm, []).append(pos)
+        
+        self.keyword_count = len(keywords)
+        self.automaton = AhoCorasick(keywords)
+    
+    @classmethod
+    def qualifies(cls, kw_lower: str) -> bool:
+        """
+        Keywords should be specific: "iso9001", "มาตรฐานiso" not just "iso".
+        Skip repeated chars like "มีมีมี" (unique chars < 3) and short keywords.
+        """
+        return len(kw_lower) >= cls.MIN_KEYWORD_LENGTH and len(set(kw_lower)) >= cls.MIN_UNIQUE_CHARS
+    
+    def match_keywords(self, query_lower: str) -> set[int]:
+        """Positions of items with at least one keyword in the query"""
+        return self.automaton.match(query_lower)
+    
+    def match_exact(self, query_lower: str) -> list[int]:
+        """Positions of items whose question equals the query"""
+        return self.exact.get(query_lower, [])
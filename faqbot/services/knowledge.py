@@ -1,21 +1,118 @@
 """
-Knowledge Base - JSON-based Q&A storage with keyword + fuzzy search
+Knowledge Base - JSON-based Q&A storage with keyword + BM25 lexical search
 """
 
 import os
+import re
 import json
-from typing import Optional
-from difflib import SequenceMatcher
+import pickle
+import hashlib
+import threading
+from typing import Callable, Optional
 
 from config import Config
+from .keyword_index import KeywordIndex
+from .lexical import Analyzer, BM25Index
+from .doc_store import DocStore, shared_doc_store, prune_doc_stores
+from . import artifacts
+
+
+class RetrievalResult:
+    """
+    Search results for one question, computed once per request.
+    Shared by the direct-answer decision, LLM context and fallbacks.
+    """
+    
+    def __init__(
+        self,
+        results: list[dict],
+        keyword_results: list[dict],
+        direct: Optional[dict] = None,
+        context: Optional[str] = None,
+        query_vector=None,
+        context_docs: Optional[list[dict]] = None,
+    ):
+        self.results = results
+        self.keyword_results = keyword_results
+        self.direct = direct
+        self.context = context
+        # Normalized query embedding (hybrid search only) - numpy (1, dim) or None
+        self.query_vector = query_vector
+        # Results that went into `context`, in order
+        self.context_docs = context_docs or []
+    
+    @property
+    def context_key(self) -> str:
+        """Fingerprint of the LLM context - ordered (doc_id, doc_version) pairs"""
+        return ",".join(f"{d['id']}@{d['version']}" for d in self.context_docs)
+    
+    @property
+    def fallback(self) -> Optional[dict]:
+        """Top context doc - answers as-is when the LLM is unavailable or over budget"""
+        return self.context_docs[0] if self.context_docs else None
+
+
+def assign_doc_ids(items: list[dict]) -> list[dict]:
+    """
+    Give every Q&A item a stable `id` and a content `version` (in place).
+    id: explicit "id" from JSON, else hash of the question text.
+    version: hash of the item content - changes whenever the item is edited.
+    """
+    seen = {}
+    for item in items:
+        content = {k: v for k, v in item.items() if k not in ("id", "version")}
+        
+        doc_id = str(item["id"]) if item.get("id") not in (None, "") else (
+            hashlib.sha1(item.get("q", "").strip().encode()).hexdigest()[:12]
+        )
+        # Duplicate questions still get distinct ids
+        seen[doc_id] = seen.get(doc_id, 0) + 1
+        if seen[doc_id] > 1:
+            doc_id = f"{doc_id}-{seen[doc_id]}"
+        
+        item["id"] = doc_id
+        item["version"] = hashlib.sha1(
+            json.dumps(content, sort_keys=True, ensure_ascii=False).encode()
+        ).hexdigest()[:12]
+    return items
+
+
+class KBSnapshot:
+    """
+    Immutable view of one KB load - data + indexes built together.
+    Published with a single reference swap so readers never see a half-built KB.
+    """
+    
+    def __init__(
+        self,
+        data: dict,
+        index: KeywordIndex,
+        lexical: BM25Index,
+        signature: Optional[tuple] = None,
+        version: Optional[str] = None,
+        artifact: Optional[str] = None,
+    ):
+        self.data = data
+        self.index = index
+        self.lexical = lexical
+        # File stat the snapshot was built from (None = empty fallback KB)
+        self.signature = signature
+        # Content version - changes when any doc is added, removed or edited
+        self.version = version or hashlib.sha1(
+            ",".join(f"{item['id']}@{item['version']}" for item in data.get("qa", [])).encode()
+        ).hexdigest()[:12]
+        # Published artifact directory (INDEX_ARTIFACTS) - the FAISS index is swapped from the same build
+        self.artifact = artifact
 
 
 class KnowledgeBase:
-    """Simple JSON-based Knowledge Base with keyword + fuzzy search"""
+    """Simple JSON-based Knowledge Base with keyword + BM25 lexical search"""
     
     _instance = None
-    _data = None
-    _last_loaded = None
+    _snapshot: Optional[KBSnapshot] = None
+    _failed_signature: Optional[tuple] = None
+    _listeners: list[Callable[[KBSnapshot], None]] = []
+    _load_lock = threading.Lock()
     
     @classmethod
     def get_instance(cls):
@@ -23,27 +120,144 @@ class KnowledgeBase:
             cls._instance = cls()
         return cls._instance
     
-    def load(self, force: bool = False):
-        """Load knowledge.json"""
-        filepath = Config.KNOWLEDGE_FILE
-        
-        if not os.path.exists(filepath):
-            print(f"[WARN] Knowledge file not found: {filepath}")
-            self._data = {"qa": [], "company_info": {}}
-            return
+    def load(self, force: bool = False) -> bool:
+        """
+        Load knowledge.json (or the published artifact with INDEX_ARTIFACTS) and
+        publish a new snapshot if it changed.
+        Called at startup, by KBWatcher and by /api/kb/reload - never per request.
+        Returns True if a new snapshot was published.
+        """
+        if Config.INDEX_ARTIFACTS:
+            filepath = artifacts.current_artifact() or artifacts.pointer_path()
+            name = "Published index artifact"
+        else:
+            filepath = Config.KNOWLEDGE_FILE
+            name = "Knowledge file"
         
-        mtime = os.path.getmtime(filepath)
-        if not force and self._last_loaded and mtime <= self._last_loaded:
-            return
+        with self._load_lock:
+            current = self._snapshot
+            
+            if not os.path.exists(filepath):
+                if current is not None:
+                    print(f"[WARN] {name} not found: {filepath} (keeping loaded KB)")
+                    return False
+                print(f"[WARN] {name} not found: {filepath}")
+                self._publish(self._build_snapshot({"qa": [], "company_info": {}}))
+                return True
+            
+            stat = os.stat(filepath)
+            # (mtime, size, inode) - also catches editors that replace the file via rename
+            signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            if not force and current is not None and signature in (current.signature, self._failed_signature):
+                return False
+            
+            try:
+                if Config.INDEX_ARTIFACTS:
+                    snapshot = self._open_artifact(filepath, signature)
+                else:
+                    with open(filepath, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    snapshot = self._build_snapshot(data, signature)
+            except Exception as e:
+                # Don't re-parse the same broken file on every poll
+                self._failed_signature = signature
+                if current is not None:
+                    print(f"[ERROR] Failed to load KB: {e} (keeping loaded KB)")
+                    return False
+                print(f"[ERROR] Failed to load KB: {e}")
+                snapshot = self._build_snapshot({"qa": [], "company_info": {}})
+            
+            self._publish(snapshot)
+            print(f"[INFO] Loaded KB: {len(snapshot.data.get('qa', []))} items, "
+                  f"{snapshot.index.keyword_count} keywords, {len(snapshot.lexical.postings)} lexical terms indexed")
+            return True
+    
+    def on_reload(self, callback: Callable[[KBSnapshot], None]):
+        """Call `callback(snapshot)` after every publish (may run in the watcher thread)"""
+        self._listeners.append(callback)
+    
+    def _publish(self, snapshot: KBSnapshot):
+        self._snapshot = snapshot
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"[WARN] KB reload listener failed: {e}")
+    
+    def _snap(self) -> KBSnapshot:
+        """Current snapshot - in-memory only, loads once if nothing is published yet"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.load()
+            snapshot = self._snapshot
+        return snapshot
+    
+    def _build_snapshot(self, data: dict, signature: Optional[tuple] = None) -> KBSnapshot:
+        snapshot = self.index_data(data, signature)
+        if Config.MMAP_SERVING and snapshot.data.get("qa"):
+            self._share_docs(snapshot)
+        return snapshot
+    
+    def index_data(self, data: dict, signature: Optional[tuple] = None) -> KBSnapshot:
+        """Assign doc ids and build keyword + lexical indexes for freshly loaded data"""
+        qa = data.get("qa", [])
+        assign_doc_ids(qa)
+        return KBSnapshot(data, KeywordIndex(qa), self._build_lexical(qa), signature)
+    
+    @staticmethod
+    def artifact_files(snapshot: KBSnapshot) -> dict:
+        """Artifact writers for the KB half of a build (see services.artifacts)"""
+        def write_indexes(path):
+            with open(path, "wb") as f:
+                pickle.dump({
+                    "index": snapshot.index,
+                    "lexical": snapshot.lexical,
+                    "company_info": snapshot.data.get("company_info", {}),
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
         
+        return {
+            "docs.bin": lambda path: DocStore.write(path, snapshot.data.get("qa", []), {"kb_version": snapshot.version}),
+            "kb.pkl": write_indexes,
+        }
+    
+    @staticmethod
+    def _open_artifact(path: str, signature: tuple) -> KBSnapshot:
+        """Prebuilt KB: mapped docs + unpickled indexes - nothing is parsed or re-indexed"""
+        manifest = artifacts.read_manifest(path, verify=Config.ARTIFACT_VERIFY)
+        docs = DocStore(os.path.join(path, "docs.bin"))
+        with open(os.path.join(path, "kb.pkl"), "rb") as f:
+            parts = pickle.load(f)
+        data = {"qa": docs, "company_info": parts["company_info"]}
+        return KBSnapshot(data, parts["index"], parts["lexical"], signature, manifest["kb_version"], path)
+    
+    @staticmethod
+    def _share_docs(snapshot: KBSnapshot):
+        """Replace the parsed Q&A dicts with the mmap store every worker shares (indexes are positional)"""
+        name = f"kb-{snapshot.version}"
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                self._data = json.load(f)
-            self._last_loaded = mtime
-            print(f"[INFO] Loaded KB: {len(self._data.get('qa', []))} items")
+            store = shared_doc_store(name, snapshot.data["qa"])
         except Exception as e:
-            print(f"[ERROR] Failed to load KB: {e}")
-            self._data = {"qa": [], "company_info": {}}
+            print(f"[WARN] Shared doc store unavailable, keeping KB in process memory: {e}")
+            return
+        snapshot.data = {**snapshot.data, "qa": store}
+        prune_doc_stores("kb-", name)
+    
+    def _build_lexical(self, qa: list[dict]) -> BM25Index:
+        """BM25 over question variants (match fields) + keywords"""
+        # Thai keywords extend the segmenter dictionary
+        thai_keywords = {
+            kw.lower() for item in qa for kw in item.get("keywords", [])
+            if re.fullmatch(r"[\u0E00-\u0E7F]+", kw)
+        }
+        analyzer = Analyzer(self.STOPWORDS, thai_keywords)
+        docs = [
+            (
+                [item.get("q", ""), item.get("q_en", ""), item.get("q_ja", "")],
+                list(item.get("keywords", [])),
+            )
+            for item in qa
+        ]
+        return BM25Index(analyzer, docs)
     
     # Thai + English stopwords (common words that don't carry meaning)
     STOPWORDS = {
@@ -51,6 +265,7 @@ class KnowledgeBase:
         "มี", "ไหม", "ที่", "ได้", "ไป", "มา", "จะ", "ว่า", "ให้", "ของ", "และ", "หรือ",
         "ไม่", "เป็น", "อยู่", "นี้", "นั้น", "ก็", "แล้ว", "กับ", "จาก", "ใน", "บน",
         "คือ", "ทำ", "ยัง", "ถ้า", "เมื่อ", "อะไร", "ทำไม", "อย่างไร", "เท่าไหร่",
+        "ยังไง", "บ้าง", "ไหน", "ที่ไหน", "ตรงไหน", "เมื่อไหร่", "เมื่อไร", "กี่", "เท่าไร", "มั้ย",
         "ครับ", "ค่ะ", "คะ", "นะ", "สิ", "ล่ะ", "หน่อย",
         # English
         "a", "an", "the", "is", "are", "was", "were", "be", "been", "being",
@@ -61,61 +276,33 @@ class KnowledgeBase:
         "what", "which", "who", "whom", "how", "when", "where", "why",
     }
     
-    def _similarity(self, a: str, b: str) -> float:
-        """Disabled - fuzzy match causes too many false positives"""
-        # SequenceMatcher matches "มีแมวไหม" to "บริษัทมีมาตรฐาน ISO อะไรไหม"
-        # because of common substrings "มี" and "ไหม"
-        # Use FAISS for semantic similarity instead
-        return 0.0
-    
-    def _keyword_match(self, query: str, text: str) -> float:
-        """
-        Score by keyword overlap.
-        For Thai: only match explicit keywords from KB, not substrings.
-        This function is now mostly disabled - rely on FAISS for semantic.
-        """
-        # Disable loose matching - too many false positives with Thai
-        # Only FAISS semantic + explicit keywords array should match
-        return 0.0
-    
     def search(self, query: str) -> list[dict]:
         """Search KB - explicit keywords only, FAISS handles semantic"""
-        self.load()
+        snapshot = self._snap()
         
-        if not self._data or not self._data.get("qa"):
+        if not snapshot.data.get("qa"):
             return []
         
         results = []
         query_lower = query.lower().strip()
+        qa = snapshot.data["qa"]
         
-        for item in self._data["qa"]:
-            q = item.get("q", "")
-            a = item.get("a", "")
-            keywords = item.get("keywords", [])
-            
-            # ONLY match explicit keywords from JSON
-            # Keywords should be specific: "iso9001", "มาตรฐานiso" not just "iso"
-            kw_score = 0
-            for kw in keywords:
-                kw_lower = kw.lower()
-                # Skip if keyword is just repeated chars like "มีมีมี"
-                unique_chars = len(set(kw_lower))
-                if unique_chars < 3:
-                    continue
-                # Require keyword length >= 5 AND unique chars >= 3
-                if len(kw_lower) >= 5 and kw_lower in query_lower:
-                    kw_score = max(kw_score, 0.8)
-            
-            # Exact question match only
-            exact = False
-            if query_lower == q.lower().strip():
-                kw_score = 1.0
-                exact = True
+        # ONLY match explicit keywords from JSON - one automaton pass over the query
+        keyword_hits = snapshot.index.match_keywords(query_lower)
+        # Exact question match - hash lookup
+        exact_hits = set(snapshot.index.match_exact(query_lower))
+        
+        for pos in sorted(keyword_hits | exact_hits):
+            item = qa[pos]
+            exact = pos in exact_hits
+            kw_score = 1.0 if exact else 0.8
             
             if kw_score >= Config.SIMILARITY_THRESHOLD:
                 results.append({
-                    "q": q,
-                    "a": a,
+                    "id": item["id"],
+                    "version": item["version"],
+                    "q": item.get("q", ""),
+                    "a": item.get("a", ""),
                     "score": round(kw_score, 3),
                     "exact": exact
                 })
@@ -123,10 +310,70 @@ class KnowledgeBase:
         results.sort(key=lambda x: x["score"], reverse=True)
         return results[:Config.MAX_SEARCH_RESULTS]
     
-    def get_direct_answer(self, query: str) -> Optional[dict]:
-        """Try to get a direct answer (exact match)"""
+    def lexical_search(self, query: str, top_k: Optional[int] = None) -> list[dict]:
+        """
+        BM25 search over segmented questions + keywords.
+        score (0-1) = how closely the query matches one question variant.
+        """
+        snapshot = self._snap()
+        
+        if not snapshot.data.get("qa"):
+            return []
+        
+        qa = snapshot.data["qa"]
+        results = []
+        for pos, score, bm25 in snapshot.lexical.search(query, top_k or Config.MAX_SEARCH_RESULTS):
+            if score < Config.LEXICAL_MIN_SCORE:
+                continue
+            item = qa[pos]
+            results.append({
+                "id": item["id"],
+                "version": item["version"],
+                "q": item.get("q", ""),
+                "a": item.get("a", ""),
+                "score": round(score, 3),
+                "bm25": round(bm25, 3),
+                "exact": False
+            })
+        return results
+    
+    def lexical_direct_answer(self, lexical_results: list[dict]) -> Optional[dict]:
+        """Direct answer from a near-identical lexical match (no embedding / LLM needed)"""
+        if not lexical_results:
+            return None
+        
+        top = lexical_results[0]
+        if top["score"] >= Config.LEXICAL_DIRECT_THRESHOLD:
+            return {
+                "answer": top["a"],
+                "source": top["q"],
+                "score": top["score"],
+                "used_llm": False
+            }
+        
+        return None
+    
+    def retrieve(self, query: str) -> RetrievalResult:
+        """Search once and derive direct answer + LLM context from the same results"""
         results = self.search(query)
+        lexical_results = self.lexical_search(query)
+        direct = self._direct_answer(results) or self.lexical_direct_answer(lexical_results)
         
+        # Keyword hits first, confident BM25 hits when keywords found nothing
+        lexical_context = [r for r in lexical_results if r["score"] >= Config.LEXICAL_CONTEXT_THRESHOLD]
+        context_docs = (results or lexical_context) if not direct else []
+        context = self._build_context(context_docs)
+        return RetrievalResult(results, results, direct, context, context_docs=context_docs)
+    
+    def get_direct_answer(self, query: str) -> Optional[dict]:
+        """Try to get a direct answer (exact match)"""
+        return self._direct_answer(self.search(query))
+    
+    def get_context_for_llm(self, query: str) -> Optional[str]:
+        """Get context from KB for LLM to summarize/combine"""
+        return self._build_context(self.search(query))
+    
+    def _direct_answer(self, results: list[dict]) -> Optional[dict]:
         if not results:
             return None
         
@@ -141,10 +388,7 @@ class KnowledgeBase:
         
         return None
     
-    def get_context_for_llm(self, query: str) -> Optional[str]:
-        """Get context from KB for LLM to summarize/combine"""
-        results = self.search(query)
-        
+    def _build_context(self, results: list[dict]) -> Optional[str]:
         if not results:
             return None
         
@@ -154,11 +398,13 @@ class KnowledgeBase:
         
         return "\n\n".join(context_parts)
     
+    def get_artifact(self) -> Optional[str]:
+        """Directory of the loaded artifact (INDEX_ARTIFACTS), else None"""
+        return self._snap().artifact
+    
     def get_company_info(self) -> dict:
-        self.load()
-        return self._data.get("company_info", {})
+        return self._snap().data.get("company_info", {})
     
     def get_all_qa(self) -> list[dict]:
         """Get all Q&A items for FAISS indexing"""
-        self.load()
-        return self._data.get("qa", [])
\ No newline at end of file
+        return self._snap().data.get("qa", [])
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""
+Lexical Search - multilingual tokenizer (Thai / English / Japanese) + BM25 index
+"""
+
+import re
+import math
+from array import array
+from typing import Iterable, Optional
+
+
+# Common Thai words for maximal-matching segmentation (no downloaded models).
+# Extended at KB load time with Thai keywords and stopwords from the KB.
+THAI_WORDS = frozenset("""
+    บริษัท บริการ ให้บริการ ราคา ค่าบริการ ค่าใช้จ่าย ค่า บาท ฟรี ส่วนลด โปรโมชั่น
+    ติดต่อ สอบถาม ถาม ตอบ ช่วย ช่วยเหลือ แนะนำ อยาก ต้องการ ต้อง ควร ขอ รู้ ทราบ
+    สมัคร สมาชิก สมัครงาน งาน ทำงาน หางาน รับสมัคร ตำแหน่ง เงินเดือน สวัสดิการ
+    ที่อยู่ อยู่ ไหน ที่ไหน ตรงไหน แถว ใกล้ ไกล สถานที่ สำนักงาน ออฟฟิศ สาขา แผนที่
+    เดินทาง ไป มา ยังไง อย่างไร ทาง รถ รถไฟฟ้า สถานี จอด ที่จอดรถ
+    เบอร์ โทร โทรศัพท์ มือถือ อีเมล เมล ไลน์ เว็บ เว็บไซต์ ออนไลน์
+    เวลา ทำการ เปิด ปิด วัน วันหยุด หยุด จันทร์ อังคาร พุธ พฤหัส ศุกร์ เสาร์ อาทิตย์
+    โมง กี่โมง นาที ชั่วโมง ปี เดือน สัปดาห์ วันนี้ พรุ่งนี้ เมื่อไหร่ เมื่อไร นาน
+    ชื่อ ทางการ ว่า อะไร บ้าง คือ เป็น มี ไม่มี ได้ ไม่ได้ ใคร กี่ คน จำนวน เท่าไหร่ เท่าไร
+    ใน เครือ ในเครือ ลูก บริษัทลูก เกี่ยวข้อง ไทย ประเทศ ญี่ปุ่น ภาษาญี่ปุ่น อังกฤษ จีน
+    กรุงเทพ มหานคร ถนน ซอย อาคาร ชั้น ห้อง เขต แขวง
+    ลูกค้า หลัก พนักงาน ทีม ผู้จัดการ ฝ่าย ขาย ฝ่ายขาย บุคคล
+    มาตรฐาน คุณภาพ รับรอง ใบรับรอง ใบเสนอราคา เสนอ คุย คุยงาน โครงการ สนใจ
+    แปล ภาษา แปลภาษา ล่าม รองรับ เรื่อง ข้อมูล ฐานข้อมูล ระบบ จัดการ ผลิต แก้ไข เผยแพร่
+    ออกแบบ กราฟิก สื่อ พิมพ์ งานพิมพ์ ของสมนาคุณ ของแจก ของที่ระลึก
+    วิดีโอ วีดีโอ ถ่ายทำ ตัดต่อ ภาพ รูป วางแผน แผน กระบวนการ ขั้นตอน
+    สรุป ของ ด่วน ฉุกเฉิน ตัวอย่าง ผลงาน ระยะเวลา เสร็จ ประมาณ ประสบการณ์
+    ก่อตั้ง ทุน จดทะเบียน สินค้า สั่ง ซื้อ ส่ง คืน รับ ยกเลิก ชำระ เงิน จ่าย
+    ทำ ใช้ ให้ ดู หา เอา ทำไม ถ้า เมื่อ แล้ว ยัง และ หรือ กับ จาก ที่ นี้ นั้น
+    ครับ ค่ะ คะ นะ ไหม มั้ย หน่อย บ้าง ล่ะ สิ
+""".split())
+
+_THAI_COMBINING = re.compile("[\u0E31\u0E34-\u0E3A\u0E47-\u0E4E]")
+_THAI_LEADING = "เแโใไ"
+
+_THAI = "\u0E00-\u0E7F"
+_JAPANESE = "\u3040-\u30FF\u3400-\u4DBF\u4E00-\u9FFF\uFF66-\uFF9F"
+_RUNS = re.compile(
+    f"([{_THAI}]+)"                      # Thai
+    f"|([{_JAPANESE}]+)"                 # Japanese (kana + kanji)
+    f"|([^\\W_{_THAI}{_JAPANESE}]+)"     # Latin / digits
+)
+
+
+class ThaiSegmenter:
+    """
+    Dictionary-based maximal matching.
+    Picks the segmentation with the fewest unknown characters, then the fewest words.
+    Never splits inside a Thai character cluster (vowel / tone marks stay attached).
+    """
+    
+    _END = ""
+    
+    def __init__(self, words: Iterable[str]):
+        self._trie: dict = {}
+        for word in words:
+            node = self._trie
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[self._END] = True
+    
+    def _words_at(self, text: str, start: int) -> Iterable[int]:
+        """End positions of dictionary words starting at `start`"""
+        node = self._trie
+        for i in range(start, len(text)):
+            node = node.get(text[i])
+            if node is None:
+                return
+            if self._END in node and self._is_boundary(text, i + 1):
+                yield i + 1
+    
+    @staticmethod
+    def _is_boundary(text: str, pos: int) -> bool:
+        return pos >= len(text) or not _THAI_COMBINING.match(text[pos])
+    
+    @staticmethod
+    def _next_cluster(text: str, start: int) -> int:
+        """End of the character cluster starting at `start`"""
+        end = start + 1
+        if text[start] in _THAI_LEADING and end < len(text):
+            end += 1
+        while end < len(text) and _THAI_COMBINING.match(text[end]):
+            end += 1
+        return end
+    
+    def segment(self, text: str) -> list[str]:
+        n = len(text)
+        # best[i] = (unknown chars, words, previous position, is dictionary word)
+        best: list[Optional[tuple[int, int, int, bool]]] = [None] * (n + 1)
+        best[0] = (0, 0, -1, True)
+        
+        for i in range(n):
+            if best[i] is None:
+                continue
+            unknown, words = best[i][0], best[i][1]
+            
+            for j in self._words_at(text, i):
+                cand = (unknown, words + 1, i, True)
+                if best[j] is None or cand[:2] < best[j][:2]:
+                    best[j] = cand
+            
+            j = self._next_cluster(text, i)
+            cand = (unknown + (j - i), words + 1, i, False)
+            if best[j] is None or cand[:2] < best[j][:2]:
+                best[j] = cand
+        
+        # Backtrack, merging consecutive unknown clusters into one token
+        pieces: list[tuple[str, bool]] = []
+        pos = n
+        while pos > 0:
+            _, _, prev, known = best[pos]
+            piece = text[prev:pos]
+            if not known and pieces and not pieces[-1][1]:
+                pieces[-1] = (piece + pieces[-1][0], False)
+            else:
+                pieces.append((piece, known))
+            pos = prev
+        
+        return [piece for piece, _ in reversed(pieces)]
+
+
+class Analyzer:
+    """
+    Text → tokens.
+    Thai: dictionary segmentation. Japanese: character bigrams. Latin: lowercase words.
+    Stopwords are dropped.
+    """
+    
+    def __init__(self, stopwords: Iterable[str] = (), extra_words: Iterable[str] = ()):
+        self.stopwords = frozenset(w.lower() for w in stopwords)
+        self.segmenter = ThaiSegmenter(THAI_WORDS | self.stopwords | frozenset(extra_words))
+    
+    def tokenize(self, text: str) -> list[str]:
+        tokens = []
+        for thai, japanese, latin in _RUNS.findall(text.lower()):
+            if thai:
+                tokens.extend(self.segmenter.segment(thai))
+            elif japanese:
+                if len(japanese) == 1:
+                    tokens.append(japanese)
+                else:
+                    tokens.extend(japanese[i:i + 2] for i in range(len(japanese) - 1))
+            elif latin not in self.stopwords:
+                # Light plural folding: services → service
+                if len(latin) > 3 and latin.endswith("s") and not latin.endswith("ss"):
+                    latin = latin[:-1]
+                tokens.append(latin)
+        return [t for t in tokens if t not in self.stopwords]
+
+
+class BM25Index:
+    """
+    Compact BM25 inverted index.
+    Postings: term → (doc positions, term frequencies) as typed arrays.
+    Each doc also keeps the term sets of its "match fields" (the question variants)
+    so a hit can be scored 0-1 by how closely it matches one of them.
+    """
+    
+    K1 = 1.2
+    B = 0.75
+    
+    def __init__(self, analyzer: Analyzer, docs: list[tuple[list[str], list[str]]]):
+        """docs: per doc, (match fields, extra fields) - all fields are indexed for BM25"""
+        self.analyzer = analyzer
+        self.doc_count = len(docs)
+        
+        postings: dict[str, dict[int, int]] = {}
+        doc_len = array("f")
+        field_terms: list[list[frozenset]] = []
+        
+        for pos, (match_fields, extra_fields) in enumerate(docs):
+            length = 0
+            for text in match_fields + extra_fields:
+                for token in analyzer.tokenize(text):
+                    postings.setdefault(token, {})
+                    postings[token][pos] = postings[token].get(pos, 0) + 1
+                    length += 1
+            doc_len.append(length)
+            field_terms.append([frozenset(analyzer.tokenize(t)) for t in match_fields if t])
+        
+        self.avgdl = (sum(doc_len) / len(doc_len)) if doc_len else 0.0
+        self.doc_len = doc_len
+        self.postings: dict[str, tuple[array, array]] = {
+            term: (array("I", hits.keys()), array("H", (min(tf, 65535) for tf in hits.values())))
+            for term, hits in postings.items()
+        }
+        self.idf: dict[str, float] = {
+            term: self._idf(len(hits)) for term, hits in postings.items()
+        }
+        # Unseen query terms count as maximally informative
+        self.max_idf = self._idf(0)
+        
+        self.field_terms = field_terms
+        self.field_mass = [
+            [sum(self.idf[t] for t in terms) for terms in fields] for fields in field_terms
+        ]
+    
+    def _idf(self, df: int) -> float:
+        return math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+    
+    def search(self, query: str, top_k: int) -> list[tuple[int, float, float]]:
+        """Returns [(doc position, match score 0-1, raw BM25)] ranked by match score, then BM25"""
+        terms = set(self.analyzer.tokenize(query))
+        if not terms or not self.doc_count:
+            return []
+        
+        scores: dict[int, float] = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            idf = self.idf[term]
+            for pos, tf in zip(*posting):
+                norm = self.K1 * (1 - self.B + self.B * self.doc_len[pos] / self.avgdl)
+                scores[pos] = scores.get(pos, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+        
+        if not scores:
+            return []
+        
+        # Score every candidate before cutting - a long doc can out-BM25 the near-exact match
+        query_mass = sum(self.idf.get(t, self.max_idf) for t in terms)
+        scored = [(pos, self._match_score(pos, terms, query_mass), bm25) for pos, bm25 in scores.items()]
+        scored.sort(key=lambda x: (x[1], x[2]), reverse=True)
+        return scored[:top_k]
+    
+    def _match_score(self, pos: int, terms: set[str], query_mass: float) -> float:
+        """
+        Best F1 over the doc's match fields, weighted by idf:
+        recall = query mass matched, precision = field mass matched.
+        """
+        best = 0.0
+        for field, field_mass in zip(self.field_terms[pos], self.field_mass[pos]):
+            matched = sum(self.idf[t] for t in terms & field)
+            if not matched or not field_mass:
+                continue
+            recall = matched / query_mass
+            precision = matched / field_mass
+            best = max(best, 2 * recall * precision / (recall + precision))
+        return best
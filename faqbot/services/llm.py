@@ -3,7 +3,9 @@ LLM Service - OpenAI integration for summarization and free chat
 """
 
 import asyncio
-from openai import OpenAI
+from typing import Optional
+
+from openai import AsyncOpenAI
 
 from config import Config
 
@@ -11,8 +13,9 @@ from config import Config
 class LLMService:
     """OpenAI LLM service with hallucination guard"""
     
-    def __init__(self):
-        self.client = OpenAI(api_key=Config.OPENAI_API_KEY) if Config.OPENAI_API_KEY else None
+    def __init__(self, client: Optional[AsyncOpenAI] = None):
+        # Shared async client from lifecycle (None = LLM disabled)
+        self.client = client
     
     def is_available(self) -> bool:
         return self.client is not None
@@ -43,8 +46,7 @@ Please answer the question using the information above:"""
 
         try:
             response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    self.client.chat.completions.create,
+                self.client.chat.completions.create(
                     model=Config.MODEL,
                     messages=[
                         {"role": "system", "content": system_prompt},
@@ -83,8 +85,7 @@ IMPORTANT RULES:
         
         try:
             response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    self.client.chat.completions.create,
+                self.client.chat.completions.create(
                     model=Config.MODEL,
                     messages=[
                         {"role": "system", "content": system_prompt},
@@ -0,0 +1,60 @@
+"""
+LLM Request Batch - one Redis round trip before the LLM call, one after
+"""
+
+from typing import Optional
+
+import redis.asyncio as redis
+
+from config import Config
+from .redis_breaker import redis_call
+from .cache import LLMCache
+from .budget import BudgetService
+
+
+class LLMRequestBatch:
+    """
+    Groups the Redis traffic of one LLM request:
+    - prefetch(): LLMCache lookup + today's spend in one pipeline
+    - commit(): budget INCRBYFLOAT/EXPIRE + LLMCache SETEX in one MULTI pipeline
+    Fails the same way the individual services do: no cache hit, budget
+    treated as exceeded (fail closed), writes dropped.
+    """
+    
+    def __init__(self, redis_client: redis.Redis, llm_cache: LLMCache, budget: BudgetService):
+        self.redis = redis_client
+        self.llm_cache = llm_cache
+        self.budget = budget
+    
+    async def prefetch(self, question: str, context_key: str) -> tuple[Optional[str], bool]:
+        """Returns (cached answer, budget exceeded)"""
+        # Hot answers are served from memory - no Redis round trip at all
+        cached = self.llm_cache.local.get(self.llm_cache.key_for(question, context_key))
+        if cached is not None:
+            # Lookup + hit still reach the shared stats (fire-and-forget)
+            self.llm_cache.record_hit("local", question)
+            return cached, False
+        
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            self.budget.queue_today_cost(pipe)
+            self.llm_cache.queue_get(pipe, question, context_key)
+            cost, cached, *_ = await redis_call(pipe.execute(), timeout=2.0)
+            if cached:
+                self.llm_cache.record_hit("redis")
+                self.llm_cache.local.set(self.llm_cache.key_for(question, context_key), cached)
+            return cached, self.budget.parse_cost(cost) >= Config.DAILY_BUDGET_USD
+        except Exception:
+            print("[WARN] Redis unavailable, blocking LLM (fail closed)")
+            return None, True
+    
+    async def commit(self, question: str, answer: str, context_key: str, usage: Optional[dict]):
+        """Record spend + cache the answer atomically"""
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            if usage:
+                self.budget.queue_add_cost(pipe, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+            self.llm_cache.queue_set(pipe, question, answer, context_key)
+            await redis_call(pipe.execute(), timeout=2.0)
+        except Exception as e:
+            print(f"[WARN] Failed to record LLM result: {e}")
@@ -0,0 +1,88 @@
+"""
+Local Cache - bounded in-process LRU/TTL tier in front of the Redis caches
+"""
+
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class LocalCache:
+    """
+    Per-worker LRU with a memory budget (bytes), TTL and a version tag.
+    Entries written under an older version are misses - bump the version
+    (set_version) to invalidate everything without walking the dict.
+    Used write-through: callers set() here whenever they write Redis.
+    Single event-loop access only; set_version() is a plain assignment and
+    may be called from other threads (KB reload).
+    """
+    
+    def __init__(self, name: str, max_bytes: int, ttl: float, version: str = ""):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.version = version
+        # key -> (value, size, expires_at, version)
+        self._entries: OrderedDict[str, tuple[Any, int, float, str]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _size(key: str, value: Any) -> int:
+        nbytes = getattr(value, "nbytes", None)
+        size = nbytes if nbytes is not None else sys.getsizeof(value)
+        return size + sys.getsizeof(key) + 64  # + entry overhead
+    
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        value, _, expires_at, version = entry
+        if version != self.version or expires_at <= time.monotonic():
+            self._pop(key)
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        if self.max_bytes <= 0:
+            return
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        
+        self._pop(key)
+        self._entries[key] = (value, size, time.monotonic() + (ttl or self.ttl), self.version)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._pop(oldest)
+    
+    def set_version(self, version: str):
+        """Invalidate all current entries (lazily, on next access / eviction)"""
+        if version != self.version:
+            self.version = version
+    
+    def _pop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+    
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+    
+    def get_stats(self) -> dict:
+        return {
+            f"{self.name}_entries": len(self._entries),
+            f"{self.name}_bytes": self._bytes,
+            f"{self.name}_hits": self.hits,
+            f"{self.name}_misses": self.misses,
+        }
@@ -0,0 +1,40 @@
+"""
+Shared async OpenAI client - one pooled HTTP connection pool for chat + embeddings
+"""
+
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from config import Config
+
+
+def create_openai_client() -> Optional[AsyncOpenAI]:
+    """
+    Create the process-wide AsyncOpenAI client.
+    Owned by lifecycle.lifespan - closed on shutdown.
+    Returns None if OPENAI_API_KEY is not configured.
+    """
+    if not Config.OPENAI_API_KEY:
+        return None
+    
+    limits = httpx.Limits(
+        max_connections=Config.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=Config.OPENAI_MAX_KEEPALIVE,
+        keepalive_expiry=Config.OPENAI_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(Config.LLM_TIMEOUT, connect=Config.OPENAI_CONNECT_TIMEOUT)
+    
+    try:
+        http_client = httpx.AsyncClient(http2=Config.OPENAI_HTTP2, limits=limits, timeout=timeout)
+    except ImportError:
+        # http2=True needs the "h2" package (httpx[http2])
+        print("[WARN] HTTP/2 unavailable (h2 not installed), using HTTP/1.1")
+        http_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+    
+    return AsyncOpenAI(
+        api_key=Config.OPENAI_API_KEY,
+        http_client=http_client,
+        timeout=timeout,
+    )
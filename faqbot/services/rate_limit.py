@@ -5,11 +5,176 @@ Rate Limiting - Multi-layer protection (IP + fingerprint + global)
 import time
 import asyncio
 import hashlib
+from collections import OrderedDict
+from typing import Optional
 
 import redis.asyncio as redis
+from redis.exceptions import NoScriptError
 from fastapi import Request
 
 from config import Config
+from .redis_breaker import redis_call
+
+
+# All layers in one atomic round trip. INCR + EXPIRE happen together, so a
+# counter can never be left without a TTL. Layers are checked in order and
+# stop at the first one exceeded (later counters are not incremented).
+# KEYS: minute, day, global[, fingerprint]
+# ARGV: minute limit, day limit, global limit, fingerprint limit
+# Returns: {verdict, minute count, day count, fingerprint count, global count}
+RATE_LIMIT_SCRIPT = """
+local function hit(key, ttl)
+    local n = redis.call('INCR', key)
+    if n == 1 then
+        redis.call('EXPIRE', key, ttl)
+    end
+    return n
+end
+
+local minute = hit(KEYS[1], 60)
+if minute > tonumber(ARGV[1]) then
+    return {1, minute, 0, 0, 0}
+end
+
+local day = hit(KEYS[2], 86400)
+if day > tonumber(ARGV[2]) then
+    return {2, minute, day, 0, 0}
+end
+
+local fp = 0
+if KEYS[4] then
+    fp = hit(KEYS[4], 60)
+    if fp > tonumber(ARGV[4]) then
+        return {3, minute, day, fp, 0}
+    end
+end
+
+local global = hit(KEYS[3], 60)
+if global > tonumber(ARGV[3]) then
+    return {4, minute, day, fp, global}
+end
+
+return {0, minute, day, fp, global}
+"""
+
+ALLOWED = 0
+LIMIT_MINUTE = 1
+LIMIT_DAY = 2
+LIMIT_FINGERPRINT = 3
+LIMIT_GLOBAL = 4
+
+_MESSAGES = {
+    LIMIT_MINUTE: "Please wait a moment and try again.",
+    LIMIT_DAY: "Daily limit reached. Please try again tomorrow.",
+    LIMIT_FINGERPRINT: "Please wait a moment and try again.",
+    LIMIT_GLOBAL: "Service is busy. Please try again shortly.",
+}
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "blocked_until", "blocked_verdict")
+    
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        self.blocked_until = 0.0
+        self.blocked_verdict = ALLOWED
+
+
+class LocalRateLimiter:
+    """
+    In-process pre-filter in front of the Redis limiter.
+    Token bucket per IP / fingerprint (bounded LRU) rejects clients that are
+    obviously over their limit without touching Redis. Locally rejected hits
+    are counted and synced to the Redis counters in periodic batches, so other
+    workers still see them. Redis stays authoritative - allowed requests always
+    run the full script, including the global limit.
+    """
+    
+    _instance = None
+    
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls(Config.LOCAL_RATE_LIMIT_MAX_KEYS)
+        return cls._instance
+    
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, _Bucket] = OrderedDict()
+        # Redis key → (pending increment, ttl)
+        self._pending: dict[str, tuple[int, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.rejected = 0
+    
+    def allow(self, key: str, per_minute: int, now: float) -> int:
+        """Take one token - returns ALLOWED or the verdict to reject with"""
+        capacity = per_minute * Config.LOCAL_RATE_LIMIT_BURST
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(capacity, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated) * per_minute / 60)
+            bucket.updated = now
+        
+        if now < bucket.blocked_until:
+            return bucket.blocked_verdict
+        if bucket.tokens < 1:
+            return LIMIT_MINUTE
+        bucket.tokens -= 1
+        return ALLOWED
+    
+    def block(self, key: str, until: float, verdict: int):
+        """Redis said this client is over - reject locally until the window ends"""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.tokens = 0
+            bucket.blocked_until = until
+            bucket.blocked_verdict = verdict
+    
+    def record(self, redis_key: str, ttl: int):
+        """Count a locally rejected hit against a Redis counter (synced in batches)"""
+        count, _ = self._pending.get(redis_key, (0, ttl))
+        self._pending[redis_key] = (count + 1, ttl)
+        self.rejected += 1
+    
+    async def flush(self, redis_client: redis.Redis):
+        """Push pending counts to Redis in one MULTI pipeline"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            pipe = redis_client.pipeline(transaction=True)
+            for key, (count, ttl) in pending.items():
+                pipe.incrby(key, count)
+                pipe.expire(key, ttl)
+            await redis_call(pipe.execute(), timeout=2.0)
+        except Exception as e:
+            # Counts are approximate - drop rather than retry into a struggling Redis
+            print(f"[WARN] Local rate limit sync failed ({len(pending)} keys): {e}")
+    
+    def start(self, redis_client: redis.Redis):
+        if self._task is None:
+            self._task = asyncio.create_task(self._sync_loop(redis_client))
+    
+    async def stop(self, redis_client: Optional[redis.Redis] = None):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if redis_client is not None:
+            await self.flush(redis_client)
+    
+    async def _sync_loop(self, redis_client: redis.Redis):
+        while True:
+            await asyncio.sleep(Config.LOCAL_RATE_LIMIT_SYNC_MS / 1000)
+            await self.flush(redis_client)
 
 
 class RateLimiter:
@@ -18,11 +183,24 @@ class RateLimiter:
     1. IP-based (basic)
     2. Fingerprint-based (User-Agent + Accept-Language hash)
     3. Global limit (protect against distributed attacks)
+    
+    All layers are evaluated server-side by one EVALSHA, behind an
+    in-process token bucket (LocalRateLimiter) for the IP / fingerprint layers.
     """
     
+    _script_sha: Optional[str] = None
+    
     def __init__(self, redis_client: redis.Redis):
         self.redis = redis_client
     
+    @classmethod
+    async def load_script(cls, redis_client: redis.Redis) -> str:
+        """SCRIPT LOAD once (startup) - requests then only send the SHA"""
+        cls._script_sha = await redis_call(
+            redis_client.script_load(RATE_LIMIT_SCRIPT), timeout=2.0
+        )
+        return cls._script_sha
+    
     def _get_fingerprint(self, request: Request) -> str:
         """Create fingerprint from request headers"""
         ua = request.headers.get("User-Agent", "")
@@ -30,54 +208,87 @@ class RateLimiter:
         fp = hashlib.md5(f"{ua}:{lang}".encode()).hexdigest()[:12]
         return fp
     
+    async def _evalsha(self, keys: list[str], args: list[int]) -> list[int]:
+        if self._script_sha is None:
+            await self.load_script(self.redis)
+        try:
+            return await redis_call(
+                self.redis.evalsha(self._script_sha, len(keys), *keys, *args), timeout=2.0
+            )
+        except NoScriptError:
+            # Redis restarted / script cache flushed - reload and retry once
+            await self.load_script(self.redis)
+            return await redis_call(
+                self.redis.evalsha(self._script_sha, len(keys), *keys, *args), timeout=2.0
+            )
+    
     async def check(self, ip: str, request: Request = None) -> tuple[bool, str]:
         """Check rate limit by IP + fingerprint + global"""
+        allowed, error, _ = await self.check_with_quota(ip, request)
+        return allowed, error
+    
+    async def check_with_quota(self, ip: str, request: Request = None) -> tuple[bool, str, dict]:
+        """Check rate limit and return remaining quotas from the same reply"""
+        now_f = time.time()
+        now = int(now_f)
+        fp = self._get_fingerprint(request) if request else None
+        
+        keys = [
+            f"rate:min:{ip}:{now // 60}",
+            f"rate:day:{ip}:{now // 86400}",
+            f"rate:global:{now // 60}",
+        ]
+        if fp:
+            keys.append(f"rate:fp:{fp}:{now // 60}")
+        
+        # Pre-filter: obvious over-limit clients never reach Redis
+        local = LocalRateLimiter.get_instance() if Config.LOCAL_RATE_LIMIT_ENABLED else None
+        if local:
+            verdict = local.allow(f"ip:{ip}", Config.RATE_LIMIT_PER_MINUTE, now_f)
+            if verdict == ALLOWED and fp:
+                verdict = local.allow(f"fp:{fp}", Config.RATE_LIMIT_PER_MINUTE * 2, now_f)
+                if verdict == LIMIT_MINUTE:
+                    verdict = LIMIT_FINGERPRINT
+            if verdict != ALLOWED:
+                # Mirror what the script would have counted (layers up to the one exceeded)
+                local.record(keys[0], 60)
+                if verdict in (LIMIT_DAY, LIMIT_FINGERPRINT):
+                    local.record(keys[1], 86400)
+                if verdict == LIMIT_FINGERPRINT:
+                    local.record(keys[3], 60)
+                remaining = {"minute": 0, "day": 0} if verdict == LIMIT_DAY else {"minute": 0}
+                return False, _MESSAGES[verdict], remaining
+        
         try:
-            now = int(time.time())
-            
-            # Layer 1: IP-based rate limit
-            minute_key = f"rate:min:{ip}:{now // 60}"
-            day_key = f"rate:day:{ip}:{now // 86400}"
+            args = [
+                Config.RATE_LIMIT_PER_MINUTE,
+                Config.RATE_LIMIT_PER_DAY,
+                Config.GLOBAL_RATE_LIMIT_PER_MINUTE,
+                Config.RATE_LIMIT_PER_MINUTE * 2,
+            ]
             
-            minute_count = await asyncio.wait_for(self.redis.incr(minute_key), timeout=2.0)
-            if minute_count == 1:
-                await self.redis.expire(minute_key, 60)
+            verdict, minute_count, day_count, _, global_count = (
+                int(x) for x in await self._evalsha(keys, args)
+            )
             
-            if minute_count > Config.RATE_LIMIT_PER_MINUTE:
-                return False, "Please wait a moment and try again."
-            
-            day_count = await asyncio.wait_for(self.redis.incr(day_key), timeout=2.0)
-            if day_count == 1:
-                await self.redis.expire(day_key, 86400)
-            
-            if day_count > Config.RATE_LIMIT_PER_DAY:
-                return False, "Daily limit reached. Please try again tomorrow."
-            
-            # Layer 2: Fingerprint-based
-            if request:
-                fp = self._get_fingerprint(request)
-                fp_key = f"rate:fp:{fp}:{now // 60}"
-                fp_count = await asyncio.wait_for(self.redis.incr(fp_key), timeout=2.0)
-                if fp_count == 1:
-                    await self.redis.expire(fp_key, 60)
-                
-                if fp_count > Config.RATE_LIMIT_PER_MINUTE * 2:
-                    return False, "Please wait a moment and try again."
-            
-            # Layer 3: Global rate limit
-            global_key = f"rate:global:{now // 60}"
-            global_count = await asyncio.wait_for(self.redis.incr(global_key), timeout=2.0)
-            if global_count == 1:
-                await self.redis.expire(global_key, 60)
+            remaining = {
+                "minute": max(0, Config.RATE_LIMIT_PER_MINUTE - minute_count),
+                "day": max(0, Config.RATE_LIMIT_PER_DAY - day_count),
+            }
             
-            if global_count > Config.GLOBAL_RATE_LIMIT_PER_MINUTE:
+            if verdict == LIMIT_GLOBAL:
                 print(f"[WARN] Global rate limit hit: {global_count}/min")
-                return False, "Service is busy. Please try again shortly."
+            elif local and verdict in (LIMIT_MINUTE, LIMIT_FINGERPRINT):
+                local.block(f"ip:{ip}" if verdict == LIMIT_MINUTE else f"fp:{fp}", (now // 60 + 1) * 60, verdict)
+            elif local and verdict == LIMIT_DAY:
+                local.block(f"ip:{ip}", (now // 86400 + 1) * 86400, verdict)
             
-            return True, ""
+            if verdict != ALLOWED:
+                return False, _MESSAGES[verdict], remaining
+            return True, "", remaining
         except Exception as e:
             print(f"[WARN] Rate limit Redis error: {e}")
-            return False, "Service temporarily unavailable."
+            return False, "Service temporarily unavailable.", {}
     
     async def get_remaining(self, ip: str) -> dict:
         """Get remaining quota"""
@@ -86,8 +297,9 @@ class RateLimiter:
             minute_key = f"rate:min:{ip}:{now // 60}"
             day_key = f"rate:day:{ip}:{now // 86400}"
             
-            minute_used = int(await asyncio.wait_for(self.redis.get(minute_key), timeout=2.0) or 0)
-            day_used = int(await asyncio.wait_for(self.redis.get(day_key), timeout=2.0) or 0)
+            minute_used, day_used = (
+                int(x or 0) for x in await redis_call(self.redis.mget(minute_key, day_key), timeout=2.0)
+            )
             
             return {
                 "minute": {"used": minute_used, "max": Config.RATE_LIMIT_PER_MINUTE},
@@ -0,0 +1,138 @@
+"""
+Redis Circuit Breaker - fail fast while Redis is down, recover automatically
+"""
+
+import time
+import asyncio
+from typing import Awaitable, Optional, TypeVar
+
+import redis.asyncio as redis
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+from config import Config
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Errors that say "Redis is unhealthy" (a bad command / NOSCRIPT does not)
+_FAILURES = (asyncio.TimeoutError, RedisConnectionError, RedisTimeoutError, OSError)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Redis while the breaker is open"""
+
+
+class RedisCircuitBreaker:
+    """
+    One breaker shared by every Redis-backed service in the process.
+    closed: calls go through; REDIS_BREAKER_THRESHOLD consecutive failures → open
+    open: calls raise CircuitOpenError immediately; a background probe PINGs
+          Redis every REDIS_BREAKER_COOLDOWN seconds → half_open on success
+    half_open: one trial call at a time; success → closed, failure → open
+    Services keep their own fail-closed handling - CircuitOpenError is just
+    another exception to them, raised without waiting for a timeout.
+    """
+    
+    _instance = None
+    
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+    
+    def __init__(self):
+        self.redis: Optional[redis.Redis] = None
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._trial_in_flight = False
+        self._probe_task: Optional[asyncio.Task] = None
+    
+    def set_redis(self, redis_client: redis.Redis):
+        self.redis = redis_client
+    
+    async def call(self, awaitable: Awaitable[T], timeout: float = 2.0) -> T:
+        """Await a Redis command under the breaker (replaces asyncio.wait_for)"""
+        if not self._allow():
+            # Never awaited - close it so it doesn't warn
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise CircuitOpenError("Redis circuit open")
+        
+        trial = self.state == HALF_OPEN
+        try:
+            result = await asyncio.wait_for(awaitable, timeout=timeout)
+        except _FAILURES:
+            self._on_failure()
+            raise
+        except Exception:
+            # Redis answered (e.g. ResponseError) - it is reachable
+            self._on_success()
+            raise
+        finally:
+            if trial:
+                self._trial_in_flight = False
+        self._on_success()
+        return result
+    
+    def _allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            # No probe possible (no client set) - fall back to a timed half-open
+            if self.redis is None and time.monotonic() - self.opened_at >= Config.REDIS_BREAKER_COOLDOWN:
+                self.state = HALF_OPEN
+            else:
+                return False
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+    
+    def _on_success(self):
+        if self.state != CLOSED:
+            print("[INFO] Redis circuit closed (recovered)")
+        self.state = CLOSED
+        self.failures = 0
+    
+    def _on_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= Config.REDIS_BREAKER_THRESHOLD:
+            self._open()
+    
+    def _open(self):
+        if self.state != OPEN:
+            self.trips += 1
+            print(f"[WARN] Redis circuit open after {self.failures} failures - failing fast")
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        if self.redis is not None and (self._probe_task is None or self._probe_task.done()):
+            try:
+                self._probe_task = asyncio.get_running_loop().create_task(self._probe())
+            except RuntimeError:
+                pass
+    
+    async def _probe(self):
+        """PING until Redis answers, then let one trial call through"""
+        while self.state == OPEN:
+            await asyncio.sleep(Config.REDIS_BREAKER_COOLDOWN)
+            try:
+                await asyncio.wait_for(self.redis.ping(), timeout=Config.REDIS_BREAKER_PROBE_TIMEOUT)
+            except Exception:
+                self.opened_at = time.monotonic()
+                continue
+            self.state = HALF_OPEN
+            print("[INFO] Redis circuit half-open (probe ok)")
+    
+    def get_stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "trips": self.trips}
+
+
+async def redis_call(awaitable: Awaitable[T], timeout: float = 2.0) -> T:
+    """Shorthand for RedisCircuitBreaker.get_instance().call(...)"""
+    return await RedisCircuitBreaker.get_instance().call(awaitable, timeout)
@@ -0,0 +1,125 @@
+"""
+Semantic LLM answer cache - reuse answers for paraphrased questions
+"""
+
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+import faiss
+import redis.asyncio as redis
+
+from config import Config
+from .redis_breaker import redis_call
+from .cache import LLMCache
+
+
+class SemanticCache:
+    """
+    In-memory FAISS index of recently answered query vectors (per worker).
+    A new query hits when it is within SEMANTIC_CACHE_THRESHOLD cosine similarity
+    of an answered one AND resolved to the same KB docs (same context_key).
+    Answer text lives in Redis (the LLMCache entry) - memory holds vectors + keys only.
+    """
+    
+    _instance = None
+    
+    def __init__(self):
+        self.redis: Optional[redis.Redis] = None
+        self.index = None
+        self._dim = None
+        self._next_id = 0
+        # id -> (context_key, answer key, expires_at) in insertion order
+        self._entries: OrderedDict[int, tuple[str, str, float]] = OrderedDict()
+    
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+    
+    def set_redis(self, redis_client: redis.Redis):
+        self.redis = redis_client
+    
+    def _reset(self, dim: int):
+        self._dim = dim
+        self.index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        self._entries.clear()
+    
+    def _remove(self, ids: list[int]):
+        if not ids:
+            return
+        self.index.remove_ids(np.array(ids, dtype="int64"))
+        for i in ids:
+            self._entries.pop(i, None)
+    
+    async def get(self, query_vector: Optional[np.ndarray], context_key: str) -> Optional[str]:
+        """Find cached answer for a similar question resolved to the same KB docs"""
+        if not Config.SEMANTIC_CACHE_ENABLED or query_vector is None or not self.redis:
+            return None
+        if self.index is None or self.index.ntotal == 0 or query_vector.shape[1] != self._dim:
+            return None
+        
+        k = min(Config.SEMANTIC_CACHE_CANDIDATES, self.index.ntotal)
+        scores, ids = self.index.search(query_vector, k)
+        
+        now = time.time()
+        expired = []
+        answer_key = None
+        for score, i in zip(scores[0], ids[0]):
+            if i < 0 or score < Config.SEMANTIC_CACHE_THRESHOLD:
+                break
+            entry = self._entries.get(int(i))
+            if entry is None:
+                continue
+            if entry[2] <= now:
+                expired.append(int(i))
+                continue
+            if entry[0] == context_key:
+                answer_key = entry[1]
+                matched = int(i)
+                break
+        self._remove(expired)
+        
+        if answer_key is None:
+            return None
+        
+        # Answer text: LLMCache local tier, then Redis
+        answer = LLMCache.local.get(answer_key)
+        if answer is not None:
+            return answer
+        try:
+            answer = await redis_call(self.redis.get(answer_key), timeout=2.0)
+        except Exception:
+            return None
+        
+        if not answer:
+            # Answer expired in Redis - drop stale vector
+            self._remove([matched])
+        return answer
+    
+    def add(self, query_vector: Optional[np.ndarray], context_key: str, answer_key: str):
+        """Remember an answered query vector (answer already stored under answer_key)"""
+        if not Config.SEMANTIC_CACHE_ENABLED or query_vector is None:
+            return
+        
+        if self.index is None or query_vector.shape[1] != self._dim:
+            self._reset(query_vector.shape[1])
+        
+        # Evict oldest entries beyond max size
+        overflow = len(self._entries) - Config.SEMANTIC_CACHE_MAX_SIZE + 1
+        if overflow > 0:
+            self._remove(list(self._entries)[:overflow])
+        
+        entry_id = self._next_id
+        self._next_id += 1
+        ttl = min(Config.SEMANTIC_CACHE_TTL, Config.LLM_CACHE_TTL)
+        self.index.add_with_ids(
+            np.ascontiguousarray(query_vector, dtype="float32"),
+            np.array([entry_id], dtype="int64")
+        )
+        self._entries[entry_id] = (context_key, answer_key, time.time() + ttl)
+    
+    def get_stats(self) -> dict:
+        return {"semantic_entries": len(self._entries)}
@@ -0,0 +1,120 @@
+"""
+Single-flight LLM calls - identical in-flight summarizations share one LLM call
+"""
+
+import time
+import uuid
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+import redis.asyncio as redis
+
+from config import Config
+from .redis_breaker import redis_call
+from .cache import LLMCache
+
+
+class LLMSingleFlight:
+    """
+    Coalesce identical LLM summarizations, keyed by the LLMCache key.
+    1. In-process: one future per key - later requests await the leader's answer
+    2. Cross-worker: short Redis lock - other workers poll LLMCache for the answer
+    The leader's call must write LLMCache before returning (followers read it).
+    A failed call (empty usage) is not shared - followers make their own call.
+    """
+    
+    # Shared across requests in this worker
+    _inflight: dict[str, asyncio.Future] = {}
+    
+    def __init__(self, redis_client: redis.Redis, llm_cache: LLMCache):
+        self.redis = redis_client
+        self.llm_cache = llm_cache
+    
+    async def do(
+        self,
+        question: str,
+        context_key: str,
+        call: Callable[[], Awaitable[tuple[str, dict]]],
+    ) -> tuple[str, dict, bool]:
+        """
+        Run `call` once per key across concurrent requests.
+        Returns (answer, usage, shared) - shared=True means another request paid for it.
+        """
+        key = self.llm_cache.key_for(question, context_key)
+        
+        existing = self._inflight.get(key)
+        if existing is not None:
+            answer = await asyncio.shield(existing)
+            if answer is not None:
+                return answer, {}, True
+            # Leader failed - make our own call
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            answer, usage, shared = await self._lead(key, question, context_key, call)
+            future.set_result(answer if usage or shared else None)
+            return answer, usage, shared
+        finally:
+            if not future.done():
+                future.set_result(None)
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+    
+    async def _lead(
+        self,
+        key: str,
+        question: str,
+        context_key: str,
+        call: Callable[[], Awaitable[tuple[str, dict]]],
+    ) -> tuple[str, dict, bool]:
+        lock_key = key.replace("llm_cache:", "llm_lock:", 1)
+        token = uuid.uuid4().hex
+        
+        try:
+            acquired = await redis_call(
+                self.redis.set(lock_key, token, nx=True, px=int(Config.LLM_LOCK_TTL * 1000)),
+                timeout=2.0
+            )
+        except Exception:
+            # Lock unavailable - behave like before (own call)
+            acquired = True
+            token = None
+        
+        if not acquired:
+            answer = await self._wait_for_other_worker(lock_key, question, context_key)
+            if answer is not None:
+                return answer, {}, True
+        
+        try:
+            answer, usage = await call()
+            return answer, usage, False
+        finally:
+            if token:
+                await self._release(lock_key, token)
+    
+    async def _wait_for_other_worker(self, lock_key: str, question: str, context_key: str) -> Optional[str]:
+        """Poll LLMCache while another worker holds the lock"""
+        deadline = time.monotonic() + Config.LLM_LOCK_TTL
+        while time.monotonic() < deadline:
+            await asyncio.sleep(Config.LLM_LOCK_POLL_MS / 1000)
+            
+            answer = await self.llm_cache.get(question, context_key)
+            if answer:
+                return answer
+            
+            try:
+                if not await redis_call(self.redis.exists(lock_key), timeout=2.0):
+                    # Lock gone without a cached answer - leader failed
+                    return await self.llm_cache.get(question, context_key)
+            except Exception:
+                return None
+        return None
+    
+    async def _release(self, lock_key: str, token: str):
+        """Delete lock only if still ours (may have expired and been re-taken)"""
+        try:
+            if await redis_call(self.redis.get(lock_key), timeout=2.0) == token:
+                await redis_call(self.redis.delete(lock_key), timeout=2.0)
+        except Exception:
+            pass
@@ -0,0 +1,52 @@
+"""
+Vector Codec - compact binary encoding for cached embeddings
+"""
+
+import struct
+
+import numpy as np
+
+
+# Header: 1 byte dtype code [+ float32 scale for int8], then the raw vector
+_FLOAT32 = 0
+_FLOAT16 = 1
+_INT8 = 2
+
+_CODES = {"float32": _FLOAT32, "float16": _FLOAT16, "int8": _INT8}
+_SCALE = struct.Struct("<f")
+
+
+def encode_vector(vec: np.ndarray, dtype: str = "float16") -> bytes:
+    """
+    float32: 4 B/dim (exact)
+    float16: 2 B/dim (~1e-3 relative error - plenty for cosine ranking)
+    int8:    1 B/dim + 4 B scale (symmetric per-vector quantization)
+    """
+    code = _CODES[dtype]
+    vec = np.asarray(vec, dtype="float32").ravel()
+    
+    if code == _INT8:
+        peak = float(np.abs(vec).max()) if vec.size else 0.0
+        scale = peak / 127 if peak else 1.0
+        quantized = np.clip(np.rint(vec / scale), -127, 127).astype("int8")
+        return bytes([code]) + _SCALE.pack(scale) + quantized.tobytes()
+    
+    return bytes([code]) + vec.astype("float16" if code == _FLOAT16 else "float32").tobytes()
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    """
+    Returns a float32 vector. float32 payloads are a zero-copy, read-only view
+    over `data` - copy before modifying in place.
+    """
+    code = data[0]
+    if code == _FLOAT32:
+        return np.frombuffer(data, dtype="float32", offset=1)
+    if code == _FLOAT16:
+        return np.frombuffer(data, dtype="float16", offset=1).astype("float32")
+    if code == _INT8:
+        (scale,) = _SCALE.unpack_from(data, 1)
+        vec = np.frombuffer(data, dtype="int8", offset=1 + _SCALE.size).astype("float32")
+        vec *= scale
+        return vec
+    raise ValueError(f"Unknown vector encoding: {code}")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules import as top-level packages (config, services) - same as running app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
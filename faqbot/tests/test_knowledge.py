@@ -0,0 +1,50 @@
+"""
+Knowledge Base retrieval - keyword-only path (FAISS disabled / not ready)
+"""
+
+import os
+import json
+
+import pytest
+
+from services import KnowledgeBase
+
+
+KNOWLEDGE_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "knowledge", "knowledge.json")
+
+
+@pytest.fixture
+def kb():
+    with open(KNOWLEDGE_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    kb = KnowledgeBase()
+    kb._snapshot = kb.index_data(data)
+    return kb
+
+
+@pytest.mark.parametrize("query", ["เลี้ยงแมวยังไง", "ซ่อมรถที่ไหน", "เปิดเมื่อไหร่"])
+def test_question_word_only_match_gets_no_context(kb, query):
+    """Sharing only a question word ("ยังไง", "ที่ไหน", ...) with a KB question is not a match"""
+    retrieval = kb.retrieve(query)
+    assert retrieval.context is None
+    assert retrieval.context_docs == []
+
+
+def test_lexical_match_answers_directly(kb):
+    retrieval = kb.retrieve("เดินทางไปบริษัทยังไง")
+    assert retrieval.direct is not None
+    assert retrieval.direct["source"] == "เดินทางไปบริษัทยังไง"
+
+
+def test_fallback_uses_lexical_context():
+    """No keyword hit - the fallback (LLM unavailable / over budget) is the lexical doc the LLM would get"""
+    kb = KnowledgeBase()
+    kb._snapshot = kb.index_data({"qa": [
+        {"q": "ที่จอดรถของบริษัทมีกี่คัน", "a": "20 คัน"},
+        {"q": "เวลาทำการของบริษัท", "a": "08:00-17:00"},
+    ]})
+    retrieval = kb.retrieve("ที่จอดรถ")
+    assert retrieval.direct is None
+    assert retrieval.keyword_results == []
+    assert retrieval.fallback is retrieval.context_docs[0]
+    assert retrieval.fallback["a"] == "20 คัน"